@@ -28,13 +28,22 @@ class CompareOp(str, Enum):
     gte = ">="
     lt = "<"
     lte = "<="
+    in_ = "in"
 
 
 class Condition(BaseModel):
     type: str = Field("condition", frozen=True)
     field: str
     operator: CompareOp
-    value: int | str
+    value: int | str | list[int | str]
+
+    @model_validator(mode="after")
+    def validate_value(self):
+        if (self.operator == CompareOp.in_) != isinstance(self.value, list):
+            raise ValueError("list value allowed only with operator 'in'")
+        if isinstance(self.value, list) and not self.value:
+            raise ValueError("'in' value must not be empty")
+        return self
 
 
 class ConditionGroup(BaseModel):
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+from datetime import UTC, date, datetime, time, timedelta
+
+import asyncpg
+
+from video_bot.config import get_config
+from video_bot.database.database import (
+    create_tables,
+    get_connection,
+    get_sessionmaker,
+)
+
+DELTA_FIELDS = (
+    "delta_views_count",
+    "delta_likes_count",
+    "delta_comments_count",
+    "delta_reports_count",
+)
+
+CANDIDATE_DAYS = """
+SELECT DISTINCT day FROM (
+    SELECT (created_at AT TIME ZONE 'UTC')::date AS day
+    FROM video_snapshots
+    WHERE created_at >= $1 AND created_at < $2
+    GROUP BY 1, video_id
+    HAVING count(*) > 1
+) t
+ORDER BY day
+"""
+
+CANDIDATE_VIDEOS = """
+SELECT video_id
+FROM video_snapshots
+WHERE created_at >= $1 AND created_at < $2
+GROUP BY video_id
+HAVING count(*) > 1
+"""
+
+# The last snapshot of the day keeps its cumulative counters and receives the
+# summed deltas of the whole day; the other rows of that day are deleted.
+ROLL_UP = f"""
+WITH day_rows AS (
+    SELECT id, video_id, created_at, {", ".join(DELTA_FIELDS)}
+    FROM video_snapshots
+    WHERE video_id = ANY($1::varchar[]) AND created_at >= $2 AND created_at < $3
+    FOR UPDATE
+), kept AS (
+    SELECT DISTINCT ON (video_id) video_id, id
+    FROM day_rows
+    ORDER BY video_id, created_at DESC, id DESC
+), sums AS (
+    SELECT video_id, {", ".join(f"sum({f}) AS {f}" for f in DELTA_FIELDS)}
+    FROM day_rows
+    GROUP BY video_id
+)
+UPDATE video_snapshots s
+SET {", ".join(f"{f} = sums.{f}" for f in DELTA_FIELDS)}
+FROM kept JOIN sums USING (video_id)
+WHERE s.id = kept.id
+RETURNING s.id
+"""
+
+DELETE_ROLLED_UP = """
+DELETE FROM video_snapshots
+WHERE video_id = ANY($1::varchar[])
+  AND created_at >= $2 AND created_at < $3
+  AND NOT (id = ANY($4::varchar[]))
+"""
+
+WATERMARK = "SELECT compacted_before FROM compaction_watermark WHERE id = 1"
+
+# Never moves back, so a later run with a longer --older-than-days does not
+# hide days that are already rolled up.
+ADVANCE_WATERMARK = """
+INSERT INTO compaction_watermark (id, compacted_before) VALUES (1, $1)
+ON CONFLICT (id) DO UPDATE SET compacted_before = GREATEST(
+    compaction_watermark.compacted_before, EXCLUDED.compacted_before
+)
+"""
+
+TABLE_STATS = """
+SELECT pg_total_relation_size('video_snapshots'), reltuples::bigint
+FROM pg_class
+WHERE oid = 'video_snapshots'::regclass
+"""
+
+
+async def compact_batch(
+    conn: asyncpg.Connection, video_ids: list[str], start: datetime, end: datetime
+) -> int:
+    async with conn.transaction():
+        kept = [r["id"] for r in await conn.fetch(ROLL_UP, video_ids, start, end)]
+        status = await conn.execute(DELETE_ROLLED_UP, video_ids, start, end, kept)
+    return int(status.split()[-1])
+
+
+async def compact_day(conn: asyncpg.Connection, day: date, batch_size: int) -> int:
+    start = datetime.combine(day, time(), UTC)
+    end = start + timedelta(days=1)
+    video_ids = [r["video_id"] for r in await conn.fetch(CANDIDATE_VIDEOS, start, end)]
+    removed = 0
+    for i in range(0, len(video_ids), batch_size):
+        removed += await compact_batch(conn, video_ids[i : i + batch_size], start, end)
+    return removed
+
+
+def compaction_cutoff(older_than_days: int) -> datetime:
+    """Start of the first UTC day that is kept hourly."""
+    return datetime.combine(datetime.now(UTC).date(), time(), UTC) - timedelta(
+        days=older_than_days
+    )
+
+
+async def compact(
+    older_than_days: int, batch_size: int, vacuum: bool, rescan: bool = False
+) -> dict:
+    """Rolls hourly snapshots older than the cutoff into one row per video per day.
+
+    Days are UTC calendar days, the same boundaries the date filters use, so
+    ``sum(delta_*)`` and plain distinct video counts over whole days are
+    unchanged. Anything that looks at single hourly rows is not: filters such
+    as ``delta_* > N`` with N > 0, or ``delta_* > 0`` on a counter whose hourly
+    deltas can be negative, count the rolled-up row instead of the hours, and
+    so do date ranges that cut a day. Each batch of videos is its own short
+    transaction.
+
+    The watermark in ``compaction_watermark`` is moved past a day before the
+    day is rolled up, so the ingester never treats a (partly) compacted day
+    as hourly. Scanning starts one day before the watermark, which finishes
+    an interrupted day; ``rescan`` scans everything before the cutoff.
+    """
+    cutoff = compaction_cutoff(older_than_days)
+    engine, _ = await get_sessionmaker()
+    await create_tables(engine)
+    await engine.dispose()
+
+    conn = await get_connection()
+    try:
+        watermark = await conn.fetchval(WATERMARK)
+        start = datetime.min.replace(tzinfo=UTC)
+        if watermark is not None and not rescan:
+            start = watermark - timedelta(days=1)
+        size_before, rows_before = await conn.fetchrow(TABLE_STATS)
+        if rows_before <= 0:
+            # never analyzed, the planner estimate is unknown
+            rows_before = await conn.fetchval("SELECT count(*) FROM video_snapshots")
+        removed = 0
+        for record in await conn.fetch(CANDIDATE_DAYS, start, cutoff):
+            day_end = datetime.combine(record["day"], time(), UTC) + timedelta(days=1)
+            await conn.execute(ADVANCE_WATERMARK, day_end)
+            removed_today = await compact_day(conn, record["day"], batch_size)
+            print(f"{record['day']}: removed {removed_today} rows")
+            removed += removed_today
+        await conn.execute(ADVANCE_WATERMARK, cutoff)
+        watermark = await conn.fetchval(WATERMARK)
+        if vacuum and removed:
+            await conn.execute("VACUUM (ANALYZE) video_snapshots")
+        size_after, _ = await conn.fetchrow(TABLE_STATS)
+    finally:
+        await conn.close()
+
+    row_size = size_before / rows_before if rows_before > 0 else 0
+    return {
+        "cutoff": cutoff.isoformat(),
+        "watermark": watermark.isoformat(),
+        "rows_removed": removed,
+        "size_before": size_before,
+        "size_after": size_after,
+        "estimated_freed_bytes": int(removed * row_size),
+    }
+
+
+def main():
+    config = get_config()
+    parser = argparse.ArgumentParser(
+        description="Compact old hourly video snapshots into daily rows"
+    )
+    parser.add_argument(
+        "--older-than-days", type=int, default=config.SNAPSHOT_RETENTION_DAYS
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=config.COMPACTION_BATCH_SIZE,
+        help="videos per transaction",
+    )
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="scan all days before the cutoff, not only those after the watermark",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        compact(
+            args.older_than_days,
+            args.batch_size,
+            vacuum=not args.no_vacuum,
+            rescan=args.rescan,
+        )
+    )
+    print(f"cutoff: {report['cutoff']}")
+    print(f"watermark: {report['watermark']}")
+    print(f"rows removed: {report['rows_removed']}")
+    print(
+        f"table size: {report['size_before']} -> {report['size_after']} bytes "
+        f"(~{report['estimated_freed_bytes']} bytes freed for reuse)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -13,17 +13,45 @@ class LogLevels(str, Enum):
 
 class Config(BaseSettings):
     LOG_LEVEL: LogLevels = LogLevels.INFO
+    LOG_FILE: str = "app.log"
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    LOG_PAYLOAD_SAMPLE_RATE: float = 1.0
 
     BOT_TOKEN: str
     OPENAI_KEY: str
     OPENAI_URL: str
 
+    MAX_QUESTIONS: int = 10
+
+    LLM_HEDGE: bool = False
+    LLM_HEDGE_QUANTILE: float = 0.95
+    LLM_HEDGE_DEFAULT_DELAY: float = 3.0
+    LLM_HEDGE_MIN_DELAY: float = 0.5
+
     DB_HOST: str
     DB_PORT: int
     DB_NAME: str
     DB_USER: str
     DB_PASS: str
 
+    APPROXIMATE_DISTINCT: bool = False
+
+    SLOW_QUERY_THRESHOLD_MS: float = 500.0
+    SLOW_QUERY_SAMPLE_RATE: float = 0.1
+    SLOW_QUERY_STORE: str = "slow_queries.db"
+    SLOW_QUERY_MAX_CAPTURES: int = 2
+    SLOW_QUERY_FLUSH_INTERVAL: float = 60.0
+
+    INGEST_POLL_INTERVAL: float = 5.0
+    INGEST_BATCH_SIZE: int = 1000
+    INGEST_QUEUE_SIZE: int = 4
+    INGEST_METRICS_PORT: int = 9100
+    INGEST_MAX_ATTEMPTS: int = 3
+
+    SNAPSHOT_RETENTION_DAYS: int = 21
+    COMPACTION_BATCH_SIZE: int = 1000
+
     @property
     def DB_URL(self) -> str:
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -1,3 +1,4 @@
+import asyncpg
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -31,3 +32,27 @@ async def get_sessionmaker() -> tuple[AsyncEngine, async_sessionmaker[AsyncSessi
     )
 
     return engine, AsyncSessionLocal
+
+
+async def get_connection() -> asyncpg.Connection:
+    config = get_config()
+    return await asyncpg.connect(
+        user=config.DB_USER,
+        password=config.DB_PASS,
+        database=config.DB_NAME,
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+    )
+
+
+async def get_pool(max_size: int = 10) -> asyncpg.Pool:
+    config = get_config()
+    return await asyncpg.create_pool(
+        user=config.DB_USER,
+        password=config.DB_PASS,
+        database=config.DB_NAME,
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        min_size=1,
+        max_size=max_size,
+    )
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import DateTime, ForeignKey
+from sqlalchemy import BigInteger, DateTime, ForeignKey, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -87,3 +87,63 @@ class VideoSnapshotOrm(Base):
         self.delta_reports_count = delta_reports_count
         self.created_at = created_at
         self.updated_at = updated_at
+
+
+class VideoIdSketchOrm(Base):
+    """HyperLogLog sketch of the video ids seen in snapshots of one UTC day.
+
+    ``creator_id`` is empty for the sketch over all creators; ``metric`` is
+    ``any`` or the name of a ``delta_*`` field that had to be positive.
+    """
+
+    __tablename__ = "video_id_sketches"
+    day: Mapped[date] = mapped_column(primary_key=True)
+    creator_id: Mapped[str] = mapped_column(primary_key=True)
+    metric: Mapped[str] = mapped_column(primary_key=True)
+    registers: Mapped[bytes] = mapped_column(LargeBinary)
+
+    def __init__(self, day: date, creator_id: str, metric: str, registers: bytes):
+        self.day = day
+        self.creator_id = creator_id
+        self.metric = metric
+        self.registers = registers
+
+
+class IngestedFileOrm(Base):
+    """A loaded file, identified by name, size and mtime together."""
+
+    __tablename__ = "ingested_files"
+    name: Mapped[str] = mapped_column(primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    mtime_ns: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    videos: Mapped[int]
+    snapshots: Mapped[int]
+    processed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        mtime_ns: int,
+        videos: int,
+        snapshots: int,
+        processed_at: datetime,
+    ):
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.videos = videos
+        self.snapshots = snapshots
+        self.processed_at = processed_at
+
+
+class CompactionWatermarkOrm(Base):
+    """Single row: snapshots before ``compacted_before`` may be rolled up."""
+
+    __tablename__ = "compaction_watermark"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    compacted_before: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __init__(self, id_: int, compacted_before: datetime):
+        self.id = id_
+        self.compacted_before = compacted_before
@@ -1,4 +1,6 @@
+import asyncio
 from logging import getLogger
+from time import perf_counter
 
 from aiogram import Router
 from aiogram.types import Message
@@ -18,10 +20,18 @@ from video_bot.answer import (
 )
 from video_bot.config import get_config
 from video_bot.database.models import VideoOrm, VideoSnapshotOrm
+from video_bot.llm import JsonObjectScanner, LatencyTracker
+from video_bot.logger import request_id_var
+from video_bot.plan import canonicalize, plan_shape
+from video_bot.sketch import RELATIVE_ERROR, approximate_distinct
+from video_bot.slow_queries import observe_query
 
 logger = getLogger(__name__)
 router = Router(name=__name__)
 
+LLM_ATTEMPTS = 2
+llm_latency = LatencyTracker()
+
 SYSTEM_PROMPT = """
 Ты — аналитический парсер запросов на русском языке.
 Твоя задача — преобразовывать пользовательские вопросы в СТРОГО валидный JSON,
@@ -223,21 +233,41 @@ FILTER TREE
 """
 
 
-async def make_request(req: str) -> str | None:
-    config = get_config()
-    client = AsyncOpenAI(
-        base_url=config.OPENAI_URL,
-        api_key=config.OPENAI_KEY,
-    )
+_client: AsyncOpenAI | None = None
+
+
+def get_client() -> AsyncOpenAI:
+    global _client
 
-    response = await client.chat.completions.create(
+    if _client is None:
+        config = get_config()
+        _client = AsyncOpenAI(
+            base_url=config.OPENAI_URL,
+            api_key=config.OPENAI_KEY,
+        )
+    return _client
+
+
+async def make_request(req: str) -> str | None:
+    stream = await get_client().chat.completions.create(
         model="openai/gpt-oss-120b",
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": req},
         ],
+        stream=True,
     )
-    return response.choices[0].message.content
+    scanner = JsonObjectScanner()
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            obj = scanner.feed(chunk.choices[0].delta.content or "")
+            if obj is not None:
+                return obj
+    finally:
+        await stream.close()
+    return scanner.text or None
 
 
 def build_filter(node: FilterNode, entity_cls, join_cls) -> ClauseElement:
@@ -259,6 +289,8 @@ def build_filter(node: FilterNode, entity_cls, join_cls) -> ClauseElement:
             return field < node.value
         elif op == "<=":
             return field <= node.value
+        elif op == "in":
+            return field.in_(node.value)
         else:
             raise ValueError(f"Unsupported operator {op}")
     elif isinstance(node, ConditionGroup):
@@ -320,47 +352,189 @@ def build_query(plan: Answer):
     return stmt
 
 
+async def request_answer(text) -> Answer | None:
+    started = perf_counter()
+    res = await make_request(f"Пользовательский запрос: {text}]")
+    if not res:
+        return None
+    try:
+        logger.info("received answer: %s", res, extra={"payload": True})
+        answer = canonicalize(Answer.model_validate_json(res))
+    except ValidationError:
+        logger.info("request error", exc_info=True)
+        return None
+    llm_latency.observe(perf_counter() - started)
+    return answer
+
+
+def hedge_delay() -> float | None:
+    config = get_config()
+    if not config.LLM_HEDGE:
+        return None
+    delay = llm_latency.quantile(config.LLM_HEDGE_QUANTILE)
+    if delay is None:
+        delay = config.LLM_HEDGE_DEFAULT_DELAY
+    return max(delay, config.LLM_HEDGE_MIN_DELAY)
+
+
 async def get_answer(text) -> Answer | None:
-    for _ in range(2):
-        res = await make_request(f"Пользовательский запрос: {text}]")
-        if not res:
-            return None
-        try:
-            logger.info("received answer: %s", res)
-            return Answer.model_validate_json(res)
-        except ValidationError:
-            logger.info("request error", exc_info=True)
-            pass
+    """Asks the LLM for a plan, retrying once if the answer is invalid.
+
+    With LLM_HEDGE enabled the second request is also sent when the first one
+    runs longer than the observed latency quantile; the first valid answer
+    wins and the other request is cancelled.
+    """
+    delay = hedge_delay()
+    pending = {asyncio.create_task(request_answer(text))}
+    launched = 1
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if launched < LLM_ATTEMPTS else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                try:
+                    answer = task.result()
+                except Exception:
+                    logger.warning("llm request failed", exc_info=True)
+                    continue
+                if answer:
+                    return answer
+            if launched < LLM_ATTEMPTS:
+                if not done:
+                    logger.info("hedging llm request after %.2fs", delay)
+                pending.add(asyncio.create_task(request_answer(text)))
+                launched += 1
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
 
 
 async def get_data(sessionmaker: async_sessionmaker[AsyncSession], answer: Answer):
     stmt = build_query(answer)
+    started = perf_counter()
     async with sessionmaker() as session:
         res = await session.execute(stmt)
     result = res.scalar_one()
+    observe_query(
+        sessionmaker, stmt, plan_shape(answer), (perf_counter() - started) * 1000
+    )
     return result
 
 
+async def get_data_many(
+    sessionmaker: async_sessionmaker[AsyncSession], answers: list[Answer]
+) -> list:
+    """Runs several plans as scalar subqueries of one SELECT.
+
+    Falls back to one query per plan if the combined statement fails, so a
+    single bad plan only fails its own answer. The combined statement is not
+    reported to the slow query log: its timing belongs to no single shape.
+    A failed plan's value is its exception, as with ``return_exceptions``.
+    """
+    if len(answers) <= 1:
+        return await asyncio.gather(
+            *(get_data(sessionmaker, a) for a in answers), return_exceptions=True
+        )
+    stmt = select(
+        *(
+            build_query(a).correlate(None).scalar_subquery().label(f"q{i}")
+            for i, a in enumerate(answers)
+        )
+    )
+    try:
+        async with sessionmaker() as session:
+            res = await session.execute(stmt)
+        row = res.one()
+    except Exception:
+        logger.warning("batched query failed, running one by one", exc_info=True)
+        return await asyncio.gather(
+            *(get_data(sessionmaker, a) for a in answers), return_exceptions=True
+        )
+    return list(row)
+
+
+async def get_replies(
+    sessionmaker: async_sessionmaker[AsyncSession], answers: list[Answer | None]
+) -> list[str]:
+    config = get_config()
+    replies = ["Некорректный запрос" if a is None else "" for a in answers]
+    planned = [(i, answ) for i, answ in enumerate(answers) if answ is not None]
+    approximations: list = [None] * len(planned)
+    if config.APPROXIMATE_DISTINCT:
+        approximations = await asyncio.gather(
+            *(approximate_distinct(sessionmaker, answ) for _, answ in planned),
+            return_exceptions=True,
+        )
+    exact: list[tuple[int, Answer]] = []
+    for (i, answ), approx in zip(planned, approximations):
+        if isinstance(approx, BaseException):
+            logger.warning("approximation failed, counting exactly", exc_info=approx)
+            approx = None
+        if approx is not None:
+            replies[i] = (
+                f"≈{approx} (оценка по HyperLogLog, "
+                f"погрешность до ±{2 * RELATIVE_ERROR:.1%} с вероятностью ~95%)"
+            )
+        else:
+            exact.append((i, answ))
+
+    values = await get_data_many(sessionmaker, [answ for _, answ in exact])
+    for (i, _), value in zip(exact, values):
+        if isinstance(value, BaseException):
+            replies[i] = "Некорректный запрос"
+        else:
+            replies[i] = str(value)
+    return replies
+
+
+def split_questions(text: str) -> list[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
 @router.message()
 async def handler(message: Message, sessionmaker: async_sessionmaker[AsyncSession]):
+    request_id_var.set(f"{message.chat.id}:{message.message_id}")
     logger.info(
         "got message from %s",
         message.from_user.id if message.from_user else message.chat.id,
     )
-    if not message.text:
+    questions = split_questions(message.text or "")
+    if not questions:
         await message.answer("Пустой запрос")
         return
+    max_questions = get_config().MAX_QUESTIONS
+    if len(questions) > max_questions:
+        await message.answer(
+            f"Слишком много вопросов в одном сообщении (максимум {max_questions})"
+        )
+        return
 
-    logger.info("received text: %s", message.text)
+    logger.info("received text: %s", message.text, extra={"payload": True})
+    timings: dict[str, float] = {}
+    started = perf_counter()
     try:
-        answ = await get_answer(message.text)
-        if not answ:
-            await message.answer("Некорректный запрос")
-            return
-
-        res = await get_data(sessionmaker, answ)
-        logger.info("result: %s", res)
-        await message.answer(str(res))
+        answers = await asyncio.gather(*(get_answer(q) for q in questions))
+        timings["llm_ms"] = round((perf_counter() - started) * 1000, 1)
+
+        stage = perf_counter()
+        replies = await get_replies(sessionmaker, list(answers))
+        timings["db_ms"] = round((perf_counter() - stage) * 1000, 1)
+        if len(replies) == 1:
+            reply = replies[0]
+        else:
+            reply = "\n".join(f"{i}. {r}" for i, r in enumerate(replies, 1))
+        logger.info("result: %s", reply)
+
+        stage = perf_counter()
+        await message.answer(reply)
+        timings["reply_ms"] = round((perf_counter() - stage) * 1000, 1)
     except BaseException:
         logger.error("handling error:", exc_info=True)
         await message.answer("Некорректный запрос")
+    finally:
+        timings["total_ms"] = round((perf_counter() - started) * 1000, 1)
+        logger.info("request handled", extra={"timings": timings})
@@ -0,0 +1,433 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import UTC, datetime
+from logging import getLogger
+from pathlib import Path
+from time import perf_counter
+from typing import NamedTuple
+
+import asyncpg
+from aiohttp import web
+
+from video_bot.compact_snapshots import WATERMARK
+from video_bot.config import get_config
+from video_bot.database.database import create_tables, get_pool, get_sessionmaker
+from video_bot.load_json_data import SNAPSHOT_COLUMNS, VIDEO_COLUMNS, build_records
+from video_bot.logger import setup_logger
+from video_bot.sketch import sketches_from_videos, store_sketches
+
+logger = getLogger(__name__)
+
+FILE_SUFFIXES = {".json", ".ndjson"}
+QUARANTINE_DIR = "failed"
+
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.AdminShutdownError,
+)
+
+MERGE_VIDEOS = f"""
+INSERT INTO videos ({", ".join(VIDEO_COLUMNS)})
+SELECT DISTINCT ON (id) {", ".join(VIDEO_COLUMNS)}
+FROM videos_stage
+ORDER BY id, updated_at DESC
+ON CONFLICT (id) DO UPDATE SET
+    views_count = EXCLUDED.views_count,
+    likes_count = EXCLUDED.likes_count,
+    reports_count = EXCLUDED.reports_count,
+    comments_count = EXCLUDED.comments_count,
+    updated_at = EXCLUDED.updated_at
+WHERE videos.updated_at <= EXCLUDED.updated_at
+"""
+
+# Before the compaction watermark a day may already be rolled up into one row
+# whose id differs from the hourly ones, so ON CONFLICT alone would count a
+# replayed hour twice. No watermark means nothing was ever compacted.
+MERGE_SNAPSHOTS = f"""
+INSERT INTO video_snapshots ({", ".join(SNAPSHOT_COLUMNS)})
+SELECT {", ".join(SNAPSHOT_COLUMNS)}
+FROM video_snapshots_stage s
+WHERE $1::timestamptz IS NULL OR s.created_at >= $1 OR NOT EXISTS (
+    SELECT 1
+    FROM video_snapshots v
+    WHERE v.video_id = s.video_id
+      AND v.created_at >= date_trunc('day', s.created_at, 'UTC')
+      AND v.created_at < date_trunc('day', s.created_at, 'UTC') + interval '24 hours'
+)
+ON CONFLICT (id) DO NOTHING
+"""
+
+
+class FileKey(NamedTuple):
+    """Identifies a loaded file: a file rewritten under the same name is new."""
+
+    name: str
+    size: int
+    mtime_ns: int
+
+
+def file_key(path: Path) -> FileKey:
+    stat = path.stat()
+    return FileKey(path.name, stat.st_size, stat.st_mtime_ns)
+
+
+class Batch(NamedTuple):
+    path: Path | None
+    videos: list
+    key: FileKey | None = None
+
+    @property
+    def name(self) -> str | None:
+        return self.path.name if self.path else None
+
+
+class Metrics:
+    def __init__(self):
+        self.files = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.quarantined_files = 0
+        self.skipped_lines = 0
+        self.db_retries = 0
+        self.videos = 0
+        self.snapshots = 0
+        self.last_batch_seconds = 0.0
+        self.latest_snapshot: datetime | None = None
+        self.queue: asyncio.Queue | None = None
+
+    def freshness_lag(self) -> float | None:
+        if self.latest_snapshot is None:
+            return None
+        return (datetime.now(UTC) - self.latest_snapshot).total_seconds()
+
+    def render(self) -> str:
+        values = {
+            "video_bot_ingest_files_total": self.files,
+            "video_bot_ingest_batches_total": self.batches,
+            "video_bot_ingest_failed_batches_total": self.failed_batches,
+            "video_bot_ingest_quarantined_files_total": self.quarantined_files,
+            "video_bot_ingest_skipped_lines_total": self.skipped_lines,
+            "video_bot_ingest_db_retries_total": self.db_retries,
+            "video_bot_ingest_videos_total": self.videos,
+            "video_bot_ingest_snapshots_total": self.snapshots,
+            "video_bot_ingest_last_batch_seconds": self.last_batch_seconds,
+            "video_bot_ingest_queue_depth": self.queue.qsize() if self.queue else 0,
+        }
+        lag = self.freshness_lag()
+        if lag is not None:
+            values["video_bot_ingest_freshness_lag_seconds"] = lag
+        return "".join(f"{name} {value}\n" for name, value in values.items())
+
+
+def as_utc(moment: datetime) -> datetime:
+    # naive timestamps are stored as UTC by the loader
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+
+async def apply_batch(conn: asyncpg.Connection, batch: Batch) -> tuple[int, int]:
+    """Stages the batch with COPY and merges it in one transaction.
+
+    Videos keep their newest counters and snapshot ids already stored are
+    ignored. Snapshots before the compaction watermark are also skipped
+    when their video already has a row for that day, so a replayed file
+    does not add deltas on top of a rolled-up day; late data for such days
+    is dropped. The checkpoint row for a file is written in the same
+    transaction.
+    """
+    video_records, snapshot_records = build_records(batch.videos)
+    async with conn.transaction():
+        # compaction advances the watermark before rolling a day up
+        watermark = await conn.fetchval(WATERMARK)
+        await conn.execute(
+            "CREATE TEMP TABLE videos_stage (LIKE videos) ON COMMIT DROP"
+        )
+        await conn.execute(
+            "CREATE TEMP TABLE video_snapshots_stage (LIKE video_snapshots) "
+            "ON COMMIT DROP"
+        )
+        await conn.copy_records_to_table(
+            "videos_stage", records=video_records, columns=VIDEO_COLUMNS
+        )
+        await conn.copy_records_to_table(
+            "video_snapshots_stage", records=snapshot_records, columns=SNAPSHOT_COLUMNS
+        )
+        await conn.execute(MERGE_VIDEOS)
+        status = await conn.execute(MERGE_SNAPSHOTS, watermark)
+        await store_sketches(conn, sketches_from_videos(batch.videos))
+        if batch.key:
+            await conn.execute(
+                "INSERT INTO ingested_files "
+                "(name, size, mtime_ns, videos, snapshots, processed_at) "
+                "VALUES ($1, $2, $3, $4, $5, now()) ON CONFLICT DO NOTHING",
+                *batch.key,
+                len(video_records),
+                len(snapshot_records),
+            )
+    return len(video_records), int(status.split()[-1])
+
+
+def quarantine(path: Path, key: FileKey, metrics: Metrics, seen: set[FileKey]):
+    """Moves a file that cannot be loaded out of the polled directory."""
+    target = path.parent / QUARANTINE_DIR / path.name
+    try:
+        target.parent.mkdir(exist_ok=True)
+        path.rename(target)
+    except OSError:
+        # stays in seen, so it is not retried until restart
+        logger.error("cannot quarantine %s", path, exc_info=True)
+        return
+    metrics.quarantined_files += 1
+    seen.discard(key)
+    logger.error("moved %s to %s", path, target)
+
+
+async def apply_with_retry(
+    pool: asyncpg.Pool, batch: Batch, metrics: Metrics, interval: float
+) -> tuple[int, int]:
+    """Applies a batch, waiting out connection failures instead of failing it.
+
+    The pool replaces broken connections on the next acquire, so the batch
+    goes through once the database is back.
+    """
+    while True:
+        try:
+            async with pool.acquire() as conn:
+                return await apply_batch(conn, batch)
+        except CONNECTION_ERRORS:
+            metrics.db_retries += 1
+            logger.warning(
+                "database unavailable, retrying batch %s in %ss",
+                batch.name or "<stdin>",
+                interval,
+                exc_info=True,
+            )
+            await asyncio.sleep(interval)
+
+
+async def apply_batches(
+    pool: asyncpg.Pool,
+    queue: asyncio.Queue,
+    metrics: Metrics,
+    seen: set[FileKey],
+    max_attempts: int,
+    retry_interval: float,
+):
+    attempts: dict[FileKey, int] = {}
+    while True:
+        batch: Batch = await queue.get()
+        started = perf_counter()
+        try:
+            videos, snapshots = await apply_with_retry(
+                pool, batch, metrics, retry_interval
+            )
+        except Exception:
+            logger.error("failed to apply batch %s", batch.name, exc_info=True)
+            metrics.failed_batches += 1
+            if batch.key:
+                attempts[batch.key] = attempts.get(batch.key, 0) + 1
+                if attempts[batch.key] < max_attempts:
+                    # retried on the next poll
+                    seen.discard(batch.key)
+                else:
+                    del attempts[batch.key]
+                    quarantine(batch.path, batch.key, metrics, seen)
+        else:
+            attempts.pop(batch.key, None)
+            metrics.batches += 1
+            if batch.name:
+                metrics.files += 1
+            metrics.videos += videos
+            metrics.snapshots += snapshots
+            latest = max(
+                (
+                    as_utc(datetime.fromisoformat(s["created_at"]))
+                    for v in batch.videos
+                    for s in v["snapshots"]
+                ),
+                default=None,
+            )
+            if latest and (
+                metrics.latest_snapshot is None or latest > metrics.latest_snapshot
+            ):
+                metrics.latest_snapshot = latest
+            logger.info(
+                "applied batch %s: %s videos, %s new snapshots",
+                batch.name or "<stdin>",
+                videos,
+                snapshots,
+            )
+        finally:
+            metrics.last_batch_seconds = round(perf_counter() - started, 3)
+            queue.task_done()
+
+
+def read_file(path: Path) -> list:
+    with open(path) as f:
+        if path.suffix == ".ndjson":
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)["videos"]
+
+
+async def watch_directory(
+    directory: Path,
+    queue: asyncio.Queue,
+    metrics: Metrics,
+    seen: set[FileKey],
+    interval: float,
+):
+    """Queues new files in name order; put() blocks while the writer is behind.
+
+    Producers should write files under a temporary name (or outside the
+    directory) and rename them in, so a half-written file is never read.
+    A file counts as loaded by name, size and mtime, so one replaced under
+    the same name is loaded again. Files that do not parse, or that fail to
+    apply too many times, are moved to the ``failed`` subdirectory.
+    """
+    while True:
+        for path in sorted(directory.iterdir()):
+            if path.suffix not in FILE_SUFFIXES or path.name.startswith("."):
+                continue
+            try:
+                key = file_key(path)
+            except OSError:
+                # renamed or removed since the listing
+                continue
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                videos = await asyncio.to_thread(read_file, path)
+            except OSError:
+                logger.error("cannot read %s", path, exc_info=True)
+                seen.discard(key)
+                continue
+            except (ValueError, KeyError, TypeError):
+                logger.error("cannot parse %s", path, exc_info=True)
+                quarantine(path, key, metrics, seen)
+                continue
+            await queue.put(Batch(path, videos, key))
+        await asyncio.sleep(interval)
+
+
+async def read_stdin(
+    queue: asyncio.Queue, metrics: Metrics, batch_size: int, flush_interval: float
+):
+    """Batches NDJSON videos from stdin, flushing on size or after idling.
+
+    Lines that are not a valid video are logged and skipped, so one bad
+    line does not fail the whole batch.
+    """
+    videos: list = []
+    pending: asyncio.Future | None = None
+    while True:
+        if pending is None:
+            pending = asyncio.ensure_future(asyncio.to_thread(sys.stdin.readline))
+        done, _ = await asyncio.wait({pending}, timeout=flush_interval)
+        if not done:
+            if videos:
+                await queue.put(Batch(None, videos))
+                videos = []
+            continue
+        line = pending.result()
+        pending = None
+        if not line:
+            break
+        if line.strip():
+            try:
+                video = json.loads(line)
+                build_records([video])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("skipping invalid line: %.200s", line.strip())
+                metrics.skipped_lines += 1
+                continue
+            videos.append(video)
+        if len(videos) >= batch_size:
+            await queue.put(Batch(None, videos))
+            videos = []
+    if videos:
+        await queue.put(Batch(None, videos))
+
+
+async def serve_metrics(metrics: Metrics, port: int) -> web.AppRunner:
+    async def handle(_: web.Request) -> web.Response:
+        return web.Response(text=metrics.render())
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    return runner
+
+
+async def run(directory: Path | None):
+    config = get_config()
+    engine, _ = await get_sessionmaker()
+    await create_tables(engine)
+    await engine.dispose()
+
+    # one writer; the pool only exists to replace broken connections
+    pool = await get_pool(max_size=1)
+    metrics = Metrics()
+    metrics.latest_snapshot = await pool.fetchval(
+        "SELECT max(created_at) FROM video_snapshots"
+    )
+    seen = {
+        FileKey(r["name"], r["size"], r["mtime_ns"])
+        for r in await pool.fetch("SELECT name, size, mtime_ns FROM ingested_files")
+    }
+    queue: asyncio.Queue = asyncio.Queue(maxsize=config.INGEST_QUEUE_SIZE)
+    metrics.queue = queue
+    runner = await serve_metrics(metrics, config.INGEST_METRICS_PORT)
+
+    writer = asyncio.create_task(
+        apply_batches(
+            pool,
+            queue,
+            metrics,
+            seen,
+            config.INGEST_MAX_ATTEMPTS,
+            config.INGEST_POLL_INTERVAL,
+        )
+    )
+    try:
+        if directory is not None:
+            await watch_directory(
+                directory, queue, metrics, seen, config.INGEST_POLL_INTERVAL
+            )
+        else:
+            await read_stdin(
+                queue, metrics, config.INGEST_BATCH_SIZE, config.INGEST_POLL_INTERVAL
+            )
+            await queue.join()
+    finally:
+        writer.cancel()
+        await runner.cleanup()
+        await pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Continuously ingest video batches from a directory or stdin"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--watch", type=Path, help="drop directory to poll")
+    source.add_argument(
+        "--stdin", action="store_true", help="read NDJSON videos from stdin"
+    )
+    args = parser.parse_args()
+
+    listener = setup_logger()
+    try:
+        asyncio.run(run(args.watch))
+    finally:
+        listener.stop()
+
+
+if __name__ == "__main__":
+    main()
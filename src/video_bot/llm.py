@@ -0,0 +1,59 @@
+from collections import deque
+
+
+class JsonObjectScanner:
+    """Detects the end of the first top-level JSON object in streamed text.
+
+    Tracks brace depth outside string literals, so a completion can be
+    validated as soon as its object closes instead of when the stream ends.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> str | None:
+        self.text += chunk
+        for i in range(self._pos, len(self.text)):
+            ch = self.text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._start is not None
+            elif ch == "{":
+                if self._start is None:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._pos = i + 1
+                    return self.text[self._start : i + 1]
+        self._pos = len(self.text)
+        return None
+
+
+class LatencyTracker:
+    """Rolling window of request latencies in seconds."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
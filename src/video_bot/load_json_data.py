@@ -3,14 +3,40 @@ import json
 import sys
 from datetime import datetime
 
-import asyncpg
-
-from video_bot.config import get_config
+from video_bot.database.database import get_connection
+from video_bot.sketch import sketches_from_videos, store_sketches
 
 BATCH_SIZE = 10000
 
-
-async def load_data(videos: list):
+VIDEO_COLUMNS = [
+    "id",
+    "video_created_at",
+    "views_count",
+    "likes_count",
+    "reports_count",
+    "comments_count",
+    "creator_id",
+    "created_at",
+    "updated_at",
+]
+
+SNAPSHOT_COLUMNS = [
+    "id",
+    "video_id",
+    "views_count",
+    "likes_count",
+    "reports_count",
+    "comments_count",
+    "delta_views_count",
+    "delta_likes_count",
+    "delta_reports_count",
+    "delta_comments_count",
+    "created_at",
+    "updated_at",
+]
+
+
+def build_records(videos: list) -> tuple[list[tuple], list[tuple]]:
     video_records = []
     snapshot_records = []
 
@@ -46,51 +72,29 @@ async def load_data(videos: list):
                 )
             )
 
-    config = get_config()
-    conn = await asyncpg.connect(
-        user=config.DB_USER,
-        password=config.DB_PASS,
-        database=config.DB_NAME,
-        host=config.DB_HOST,
-        port=config.DB_PORT,
-    )
+    return video_records, snapshot_records
+
+
+async def load_data(videos: list):
+    video_records, snapshot_records = build_records(videos)
+
+    conn = await get_connection()
 
     async with conn.transaction():
         await conn.copy_records_to_table(
             "videos",
             records=video_records,
-            columns=[
-                "id",
-                "video_created_at",
-                "views_count",
-                "likes_count",
-                "reports_count",
-                "comments_count",
-                "creator_id",
-                "created_at",
-                "updated_at",
-            ],
+            columns=VIDEO_COLUMNS,
         )
 
         await conn.copy_records_to_table(
             "video_snapshots",
             records=snapshot_records,
-            columns=[
-                "id",
-                "video_id",
-                "views_count",
-                "likes_count",
-                "reports_count",
-                "comments_count",
-                "delta_views_count",
-                "delta_likes_count",
-                "delta_reports_count",
-                "delta_comments_count",
-                "created_at",
-                "updated_at",
-            ],
+            columns=SNAPSHOT_COLUMNS,
         )
 
+        await store_sketches(conn, sketches_from_videos(videos))
+
     await conn.close()
 
 
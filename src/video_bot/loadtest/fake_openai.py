@@ -0,0 +1,110 @@
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+PROMPT_PREFIX = "Пользовательский запрос: "
+DEFAULT_PLAN = {
+    "entity": "video",
+    "operation": "count",
+    "field": "id",
+    "distinct": True,
+    "where": None,
+    "date_filter": None,
+    "join": None,
+}
+
+
+class FakeOpenAI:
+    """OpenAI-compatible chat completions endpoint returning canned plans.
+
+    Plans are looked up by the question text; unknown questions get
+    ``default_plan``. Every call sleeps ``latency + uniform(0, jitter)``
+    seconds before answering, streamed or not.
+    """
+
+    def __init__(
+        self,
+        plans: dict[str, dict],
+        default_plan: dict = DEFAULT_PLAN,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        chunk_size: int = 16,
+    ):
+        self.plans = plans
+        self.default_plan = default_plan
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._runner: web.AppRunner | None = None
+
+    def _plan_for(self, body: dict) -> str:
+        question = body["messages"][-1]["content"]
+        question = question.removeprefix(PROMPT_PREFIX).removesuffix("]")
+        return json.dumps(
+            self.plans.get(question, self.default_plan), ensure_ascii=False
+        )
+
+    def _chunk(self, delta: dict, finish_reason: str | None = None) -> bytes:
+        chunk = {
+            "id": f"chatcmpl-{self.calls}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "fake",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        self.calls += 1
+        body = await request.json()
+        content = self._plan_for(body)
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if not body.get("stream"):
+            return web.json_response(
+                {
+                    "id": f"chatcmpl-{self.calls}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "fake",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            await response.write(self._chunk({"role": "assistant", "content": ""}))
+            for i in range(0, len(content), self.chunk_size):
+                await response.write(
+                    self._chunk({"content": content[i : i + self.chunk_size]})
+                )
+            await response.write(self._chunk({}, "stop"))
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            # the client stops reading once the JSON object is complete
+            pass
+        return response
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
@@ -0,0 +1,66 @@
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+BOT_USER = {
+    "id": 42,
+    "is_bot": True,
+    "first_name": "video_bot",
+    "username": "video_bot",
+}
+
+
+class FakeTelegram:
+    """Minimal Bot API server that accepts and records outgoing messages.
+
+    Replies are stored per chat id so the harness can tell what the bot
+    answered to each replayed update.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.replies: dict[int, list[str]] = {}
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+
+    async def method(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        method = request.match_info["method"].lower()
+        if method == "getme":
+            return web.json_response({"ok": True, "result": BOT_USER})
+        if method != "sendmessage":
+            return web.json_response({"ok": True, "result": True})
+
+        data = await request.post()
+        chat_id = int(str(data["chat_id"]))
+        text = str(data["text"])
+        self.replies.setdefault(chat_id, []).append(text)
+        self._message_id += 1
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": text,
+                },
+            }
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
@@ -0,0 +1,214 @@
+"""Replays a corpus of questions through the bot's router under load.
+
+Telegram and the LLM are replaced by local fakes; the database is the real
+Postgres from the DB_* settings. With ``--seed`` the ``videos``,
+``video_snapshots`` and ``video_id_sketches`` tables are TRUNCATED and
+refilled with synthetic data, so point DB_NAME at a scratch database.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+CORPUS = Path(__file__).with_name("corpus.jsonl")
+ERROR_REPLIES = {"Некорректный запрос", "Пустой запрос"}
+
+
+def load_corpus(path: Path) -> list[dict]:
+    today = datetime.now(UTC).date()
+    placeholders = {
+        "{today}": today.isoformat(),
+        "{yesterday}": (today - timedelta(days=1)).isoformat(),
+        "{week_ago}": (today - timedelta(days=7)).isoformat(),
+    }
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for key, value in placeholders.items():
+                line = line.replace(key, value)
+            entries.append(json.loads(line))
+    return entries
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def seed_database(engine, videos: int, creators: int, days: int):
+    from sqlalchemy import text
+
+    from video_bot.load_json_data import load_data
+    from video_bot.loadtest.synthetic import generate_videos
+
+    data = generate_videos(videos, creators, days)
+    async with engine.begin() as conn:
+        await conn.execute(text("TRUNCATE videos, video_snapshots, video_id_sketches"))
+    await load_data(data)
+    snapshots = sum(len(v["snapshots"]) for v in data)
+    print(f"seeded {len(data)} videos, {snapshots} snapshots", file=sys.stderr)
+
+
+async def sample_pool(pool, samples: list[tuple[int, int]], interval: float):
+    while True:
+        samples.append((pool.checkedout(), pool.overflow()))
+        await asyncio.sleep(interval)
+
+
+async def run(args) -> dict:
+    from video_bot.loadtest.fake_openai import FakeOpenAI
+    from video_bot.loadtest.fake_telegram import FakeTelegram
+
+    corpus = load_corpus(args.corpus)
+    llm = FakeOpenAI(
+        {e["text"]: e["plan"] for e in corpus if e.get("plan")},
+        latency=args.llm_latency,
+        jitter=args.llm_jitter,
+    )
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    os.environ["OPENAI_URL"] = await llm.start()
+    os.environ.setdefault("OPENAI_KEY", "loadtest")
+    os.environ["BOT_TOKEN"] = "42:loadtest"
+    telegram_url = await telegram.start()
+
+    # config and handler read the environment on first use, so import late
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+
+    from video_bot.config import get_config
+    from video_bot.database.database import create_tables, get_sessionmaker
+    from video_bot.handler import router
+    from video_bot.middleware import DIMiddleware
+
+    engine, sessionmaker = await get_sessionmaker()
+    await create_tables(engine)
+    if args.seed:
+        await seed_database(engine, args.videos, args.creators, args.days)
+
+    bot = Bot(
+        token=get_config().BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)),
+    )
+    dp = Dispatcher()
+    dp.update.middleware(DIMiddleware(sessionmaker))
+    dp.include_router(router)
+
+    latencies: list[float] = []
+    failures: dict[str, int] = {}
+
+    async def send(i: int, text: str):
+        chat_id = i + 1
+        update = Update.model_validate(
+            {
+                "update_id": i,
+                "message": {
+                    "message_id": i,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "load"},
+                    "text": text,
+                },
+            },
+            context={"bot": bot},
+        )
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+            return
+        latencies.append(time.perf_counter() - started)
+        replies = telegram.replies.get(chat_id, [])
+        if not replies:
+            failures["no_reply"] = failures.get("no_reply", 0) + 1
+        elif replies[-1] in ERROR_REPLIES:
+            failures["error_reply"] = failures.get("error_reply", 0) + 1
+
+    pool_samples: list[tuple[int, int]] = []
+    sampler = asyncio.create_task(sample_pool(engine.pool, pool_samples, 0.05))
+
+    total = args.count or int(args.rate * args.duration)
+    tasks = []
+    started = time.perf_counter()
+    for i in range(total):
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text = corpus[i % len(corpus)]["text"]
+        tasks.append(asyncio.create_task(send(i, text)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    sampler.cancel()
+    await bot.session.close()
+    await engine.dispose()
+    await llm.stop()
+    await telegram.stop()
+
+    errors = sum(failures.values())
+    checked_out = [c for c, _ in pool_samples] or [0]
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "offered_rps": args.rate,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            name: round(percentile(latencies, q) * 1000, 1)
+            for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))
+        }
+        | {"max": round(max(latencies, default=0) * 1000, 1)},
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "errors": failures,
+        "llm_calls": llm.calls,
+        "pool": {
+            "size": engine.pool.size(),
+            "checked_out_max": max(checked_out),
+            "checked_out_mean": round(statistics.fmean(checked_out), 2),
+            "overflow_share": (
+                round(sum(1 for _, o in pool_samples if o > 0) / len(pool_samples), 4)
+                if pool_samples
+                else 0.0
+            ),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument(
+        "--count", type=int, help="total requests, overrides --duration"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="seconds")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument(
+        "--seed", action="store_true", help="truncate and load synthetic data"
+    )
+    parser.add_argument("--videos", type=int, default=1000)
+    parser.add_argument("--creators", type=int, default=50)
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
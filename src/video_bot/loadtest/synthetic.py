@@ -0,0 +1,60 @@
+import random
+import uuid
+from datetime import UTC, datetime, timedelta
+
+COUNTERS = ("views_count", "likes_count", "comments_count", "reports_count")
+
+
+def generate_videos(
+    videos: int, creators: int, days: int, end: datetime | None = None, seed: int = 0
+) -> list[dict]:
+    """Builds data in the ``videos.json`` format with hourly snapshots.
+
+    Each video is published at a random moment in the last ``days`` days and
+    gets one snapshot per hour from then until ``end``.
+    """
+    rnd = random.Random(seed)
+    end = (end or datetime.now(UTC)).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    creator_ids = [uuid.UUID(int=rnd.getrandbits(128)).hex for _ in range(creators)]
+
+    result = []
+    for _ in range(videos):
+        video_id = uuid.UUID(int=rnd.getrandbits(128)).hex
+        published = start + timedelta(seconds=rnd.randrange(days * 86400))
+        counters = dict.fromkeys(COUNTERS, 0)
+        snapshots = []
+        at = published.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        while at <= end:
+            deltas = {
+                "views_count": rnd.randrange(0, 500),
+                "likes_count": rnd.randrange(0, 50),
+                "comments_count": rnd.randrange(0, 10),
+                "reports_count": int(rnd.random() < 0.01),
+            }
+            for name, delta in deltas.items():
+                counters[name] += delta
+            snapshots.append(
+                {
+                    "id": uuid.UUID(int=rnd.getrandbits(128)).hex,
+                    "video_id": video_id,
+                    **counters,
+                    **{f"delta_{name}": delta for name, delta in deltas.items()},
+                    "created_at": at.isoformat(),
+                    "updated_at": at.isoformat(),
+                }
+            )
+            at += timedelta(hours=1)
+
+        result.append(
+            {
+                "id": video_id,
+                "creator_id": rnd.choice(creator_ids),
+                "video_created_at": published.isoformat(),
+                **counters,
+                "created_at": published.isoformat(),
+                "updated_at": end.isoformat(),
+                "snapshots": snapshots,
+            }
+        )
+    return result
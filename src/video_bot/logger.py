@@ -1,29 +1,119 @@
+import copy
+import json
 import logging
+import random
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 
 from video_bot.config import get_config
 
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
 
-def setup_logger():
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request id of the task that emitted them.
+
+    Must run on the emitting side of the queue: the listener thread does not
+    see the event loop's context variables.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class PayloadSamplingFilter(logging.Filter):
+    """Keeps only a fraction of records logged with ``extra={"payload": True}``."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "payload", False):
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class StructuredQueueHandler(QueueHandler):
+    """Keeps the message and the traceback apart when enqueuing a record.
+
+    The stock ``prepare()`` folds the traceback into ``msg`` and drops
+    ``exc_info``, so the formatter on the listener side cannot tell them apart.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.message = record.msg
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        timings = getattr(record, "timings", None)
+        if timings:
+            entry["timings"] = timings
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logger() -> QueueListener:
+    """Routes the root logger through a queue drained by a background thread.
+
+    The caller owns the returned listener and must ``stop()`` it on shutdown
+    so buffered records are flushed.
+    """
     config = get_config()
 
     logger = logging.getLogger()
     logger.setLevel(config.LOG_LEVEL.value)
 
+    formatter = JsonFormatter()
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(config.LOG_LEVEL.value)
-    file_handler = logging.FileHandler("app.log")
-    file_handler.setLevel(config.LOG_LEVEL.value)
-
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
     console_handler.setFormatter(formatter)
+    file_handler = RotatingFileHandler(
+        config.LOG_FILE,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
     file_handler.setFormatter(formatter)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    queue_handler = StructuredQueueHandler(SimpleQueue())
+    queue_handler.setLevel(config.LOG_LEVEL.value)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(PayloadSamplingFilter(config.LOG_PAYLOAD_SAMPLE_RATE))
+
+    logger.handlers = [queue_handler]
 
     logging.getLogger("uvicorn").handlers = logger.handlers
     logging.getLogger("uvicorn.access").handlers = logger.handlers
     logging.getLogger("fastapi").handlers = logger.handlers
+
+    listener = QueueListener(
+        queue_handler.queue,
+        console_handler,
+        file_handler,
+        respect_handler_level=True,
+    )
+    listener.start()
+    return listener
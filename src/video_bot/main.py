@@ -1,6 +1,4 @@
 import asyncio
-import logging
-import sys
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
@@ -9,7 +7,9 @@ from aiogram.enums import ParseMode
 from video_bot.config import get_config
 from video_bot.database.database import create_tables, get_sessionmaker
 from video_bot.handler import router
+from video_bot.logger import setup_logger
 from video_bot.middleware import DIMiddleware
+from video_bot.slow_queries import flush_stats
 
 
 async def main() -> None:
@@ -29,9 +29,13 @@ async def main() -> None:
     await dp.start_polling(bot)
 
     # shutdown
+    await flush_stats()
     await engine.dispose()
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    listener = setup_logger()
+    try:
+        asyncio.run(main())
+    finally:
+        listener.stop()
@@ -0,0 +1,204 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from video_bot.answer import (
+    SNAPSHOT_FIELDS,
+    Answer,
+    CompareOp,
+    Condition,
+    ConditionGroup,
+    Entity,
+    FilterNode,
+    LogicalOp,
+)
+
+LOWER_BOUNDS = {CompareOp.gt, CompareOp.gte}
+UPPER_BOUNDS = {CompareOp.lt, CompareOp.lte}
+
+
+def node_key(node: FilterNode) -> str:
+    return json.dumps(node.model_dump(mode="json"), sort_keys=True, ensure_ascii=False)
+
+
+def _value_key(value: int | str) -> tuple[str, int | str]:
+    return type(value).__name__, value
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _eq_or_in(field: str, values: set[int | str]) -> Condition:
+    ordered = sorted(values, key=_value_key)
+    if len(ordered) == 1:
+        return Condition(field=field, operator=CompareOp.eq, value=ordered[0])
+    return Condition(field=field, operator=CompareOp.in_, value=ordered)
+
+
+def _merge_ranges(conditions: list[FilterNode]) -> list[FilterNode]:
+    """Keeps only the tightest lower and upper bound per field in an AND group.
+
+    Only integer bounds are merged: string comparisons depend on the column
+    type and collation, which Python ordering does not reproduce.
+    """
+    lower: dict[str, Condition] = {}
+    upper: dict[str, Condition] = {}
+    rest: list[FilterNode] = []
+    for c in conditions:
+        if not isinstance(c, Condition) or not _is_int(c.value):
+            rest.append(c)
+        elif c.operator in LOWER_BOUNDS:
+            best = lower.get(c.field)
+            if (
+                best is None
+                or c.value > best.value
+                or (c.value == best.value and c.operator == CompareOp.gt)
+            ):
+                lower[c.field] = c
+        elif c.operator in UPPER_BOUNDS:
+            best = upper.get(c.field)
+            if (
+                best is None
+                or c.value < best.value
+                or (c.value == best.value and c.operator == CompareOp.lt)
+            ):
+                upper[c.field] = c
+        else:
+            rest.append(c)
+
+    for field in lower.keys() | upper.keys():
+        lo, hi = lower.get(field), upper.get(field)
+        if (
+            lo is not None
+            and hi is not None
+            and lo.operator == CompareOp.gte
+            and hi.operator == CompareOp.lte
+            and lo.value == hi.value
+        ):
+            rest.append(Condition(field=field, operator=CompareOp.eq, value=lo.value))
+            continue
+        rest.extend(c for c in (lo, hi) if c is not None)
+    return rest
+
+
+def _merge_equalities(conditions: list[FilterNode]) -> list[FilterNode]:
+    """Folds ``field = a OR field = b OR field IN (...)`` into one IN per field."""
+    values: dict[str, set[int | str]] = defaultdict(set)
+    rest: list[FilterNode] = []
+    for c in conditions:
+        if isinstance(c, Condition) and c.operator == CompareOp.eq:
+            values[c.field].add(c.value)  # type: ignore[arg-type]
+        elif isinstance(c, Condition) and c.operator == CompareOp.in_:
+            values[c.field].update(c.value)  # type: ignore[arg-type]
+        else:
+            rest.append(c)
+    rest.extend(_eq_or_in(field, v) for field, v in values.items())
+    return rest
+
+
+def normalize_filter(node: FilterNode) -> FilterNode:
+    if isinstance(node, Condition):
+        if node.operator == CompareOp.in_:
+            return _eq_or_in(node.field, set(node.value))  # type: ignore[arg-type]
+        return node
+
+    children: list[FilterNode] = []
+    for child in node.conditions:
+        child = normalize_filter(child)
+        if isinstance(child, ConditionGroup) and child.op == node.op:
+            children.extend(child.conditions)
+        else:
+            children.append(child)
+
+    if node.op == LogicalOp.and_:
+        children = _merge_ranges(children)
+    else:
+        children = _merge_equalities(children)
+
+    unique = {node_key(c): c for c in children}
+    children = [unique[k] for k in sorted(unique)]
+    if len(children) == 1:
+        return children[0]
+    return ConditionGroup(op=node.op, conditions=children)
+
+
+def filter_fields(node: FilterNode | None) -> set[str]:
+    if node is None:
+        return set()
+    if isinstance(node, Condition):
+        return {node.field}
+    return set().union(*(filter_fields(c) for c in node.conditions))
+
+
+def _join_needed(plan: Answer) -> bool:
+    """Whether removing ``plan.join`` could change the result.
+
+    Only the snapshot -> video join is many-to-one (enforced by the foreign
+    key), so dropping it is safe when nothing reads a video column. The
+    reverse join multiplies rows and always stays.
+    """
+    join = plan.join
+    if join is None:
+        return False
+    if not (
+        plan.entity == Entity.video_snapshots
+        and join.target_entity == Entity.video
+        and join.source_field == "video_id"
+        and join.target_field == "id"
+    ):
+        return True
+    referenced = {plan.field} | filter_fields(plan.where)
+    return not referenced <= SNAPSHOT_FIELDS
+
+
+def canonicalize(plan: Answer) -> Answer:
+    """Returns an equivalent plan in a stable, minimal form.
+
+    Flattens nested and single-child groups, removes duplicate conditions,
+    keeps only the tightest integer range per field, turns OR-ed equalities
+    into IN lists and drops joins nothing reads from.
+    """
+    where = normalize_filter(plan.where) if plan.where else None
+    plan = plan.model_copy(update={"where": where})
+    if plan.join and not _join_needed(plan):
+        plan = plan.model_copy(update={"join": None})
+    return plan
+
+
+def plan_key(plan: Answer) -> str:
+    return json.dumps(
+        plan.model_dump(mode="json", by_alias=True), sort_keys=True, ensure_ascii=False
+    )
+
+
+def plan_hash(plan: Answer) -> str:
+    """Deterministic cache key; expects a plan returned by ``canonicalize``."""
+    return hashlib.sha256(plan_key(plan).encode()).hexdigest()
+
+
+def _shape(node: FilterNode) -> dict:
+    if isinstance(node, Condition):
+        return {"field": node.field, "operator": node.operator.value}
+    children = {
+        json.dumps(s, sort_keys=True): s for s in (_shape(c) for c in node.conditions)
+    }
+    return {"op": node.op.value, "conditions": [children[k] for k in sorted(children)]}
+
+
+def plan_shape(plan: Answer) -> str:
+    """Canonical plan structure with all literal values stripped."""
+    shape = {
+        "entity": plan.entity.value,
+        "operation": plan.operation.value,
+        "field": plan.field,
+        "distinct": plan.distinct,
+        "where": _shape(plan.where) if plan.where else None,
+        "date_filter": plan.date_filter is not None,
+        "join": plan.join.model_dump(mode="json") if plan.join else None,
+    }
+    return json.dumps(shape, sort_keys=True)
+
+
+def shape_hash(shape: str) -> str:
+    return hashlib.sha256(shape.encode()).hexdigest()[:12]
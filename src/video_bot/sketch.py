@@ -0,0 +1,371 @@
+import asyncio
+import math
+import zlib
+from datetime import UTC, date, datetime, time
+from hashlib import blake2b
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from video_bot.answer import (
+    Answer,
+    CompareOp,
+    Condition,
+    ConditionGroup,
+    Entity,
+    LogicalOp,
+    Operation,
+)
+from video_bot.database.database import get_connection
+from video_bot.database.models import VideoIdSketchOrm
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ERROR = 1.04 / math.sqrt(REGISTERS)
+SPARSE_LIMIT = REGISTERS // 8
+MAX_RANK = 64 - PRECISION + 1
+
+ALL_CREATORS = ""
+ANY_METRIC = "any"
+DELTA_METRICS = (
+    "delta_views_count",
+    "delta_likes_count",
+    "delta_comments_count",
+    "delta_reports_count",
+)
+
+SketchKey = tuple[date, str, str]
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**PRECISION one-byte registers.
+
+    Small sketches keep their non-zero registers in a dict; the serialized
+    form is always the zlib-compressed dense register array.
+    """
+
+    def __init__(self, registers: bytearray | None = None):
+        self._dense = registers
+        self._sparse: dict[int, int] | None = {} if registers is None else None
+
+    def add(self, value: str):
+        x = int.from_bytes(blake2b(value.encode(), digest_size=8).digest())
+        index = x >> (64 - PRECISION)
+        rest = x & ((1 << (64 - PRECISION)) - 1)
+        self._update(index, MAX_RANK - rest.bit_length())
+
+    def _update(self, index: int, rank: int):
+        if self._sparse is not None:
+            if rank > self._sparse.get(index, 0):
+                self._sparse[index] = rank
+                if len(self._sparse) > SPARSE_LIMIT:
+                    self._densify()
+        elif rank > self._dense[index]:  # type: ignore[index]
+            self._dense[index] = rank  # type: ignore[index]
+
+    def _registers(self) -> bytearray:
+        if self._sparse is None:
+            return self._dense  # type: ignore[return-value]
+        dense = bytearray(REGISTERS)
+        for index, rank in self._sparse.items():
+            dense[index] = rank
+        return dense
+
+    def _densify(self):
+        self._dense, self._sparse = self._registers(), None
+
+    def _items(self):
+        if self._sparse is not None:
+            return self._sparse.items()
+        return ((i, r) for i, r in enumerate(self._dense) if r)  # type: ignore[arg-type]
+
+    def merge(self, other: "HyperLogLog"):
+        if other._sparse is not None:
+            for index, rank in other._sparse.items():
+                self._update(index, rank)
+            return
+        if self._sparse is not None:
+            self._densify()
+        self._dense = bytearray(map(max, self._dense, other._dense))  # type: ignore[arg-type]
+
+    def estimate(self) -> int:
+        """Ertl's improved estimator (arXiv:1702.01284).
+
+        Unlike the classic raw estimate with a linear counting switch, it
+        has no bias bump around 2.5 * REGISTERS, so RELATIVE_ERROR holds
+        for every cardinality.
+        """
+        counts = [0] * (MAX_RANK + 1)
+        for _, rank in self._items():
+            counts[rank] += 1
+        counts[0] = REGISTERS - sum(counts)
+        if counts[0] == REGISTERS:
+            return 0
+        z = REGISTERS * _tau(1 - counts[MAX_RANK] / REGISTERS)
+        for k in range(MAX_RANK - 1, 0, -1):
+            z = 0.5 * (z + counts[k])
+        z += REGISTERS * _sigma(counts[0] / REGISTERS)
+        return round(REGISTERS * REGISTERS / (2 * math.log(2)) / z)
+
+    def to_bytes(self) -> bytes:
+        # a sparse sketch stays sparse; only the serialized copy is dense
+        return zlib.compress(self._registers())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(bytearray(zlib.decompress(data)))
+
+    @classmethod
+    def union(cls, blobs: list[bytes]) -> "HyperLogLog":
+        """Merges serialized sketches in one pass over the registers."""
+        arrays = [zlib.decompress(data) for data in blobs]
+        if len(arrays) < 2:
+            return cls(bytearray(arrays[0] if arrays else REGISTERS))
+        return cls(bytearray(map(max, *arrays)))
+
+
+def _sigma(x: float) -> float:
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def utc_day(moment: datetime) -> date:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(UTC)
+    return moment.date()
+
+
+def observe(
+    sketches: dict[SketchKey, HyperLogLog],
+    day: date,
+    creator_id: str,
+    video_id: str,
+    metrics: list[str],
+):
+    """Adds one video seen on ``day`` to the overall and per-creator sketches."""
+    for creator in (ALL_CREATORS, creator_id):
+        for metric in (ANY_METRIC, *metrics):
+            sketches.setdefault((day, creator, metric), HyperLogLog()).add(video_id)
+
+
+def sketches_from_videos(videos: list) -> dict[SketchKey, HyperLogLog]:
+    """Builds sketches from data in the ``videos.json`` format."""
+    sketches: dict[SketchKey, HyperLogLog] = {}
+    for video in videos:
+        for snapshot in video["snapshots"]:
+            observe(
+                sketches,
+                utc_day(datetime.fromisoformat(snapshot["created_at"])),
+                video["creator_id"],
+                snapshot["video_id"],
+                [m for m in DELTA_METRICS if int(snapshot[m]) > 0],
+            )
+    return sketches
+
+
+SELECT_EXISTING = """
+SELECT s.day, s.creator_id, s.metric, s.registers
+FROM video_id_sketches s
+JOIN unnest($1::date[], $2::varchar[], $3::varchar[]) AS k(day, creator_id, metric)
+    USING (day, creator_id, metric)
+"""
+
+UPSERT = """
+INSERT INTO video_id_sketches (day, creator_id, metric, registers)
+VALUES ($1, $2, $3, $4)
+ON CONFLICT (day, creator_id, metric) DO UPDATE SET registers = EXCLUDED.registers
+"""
+
+
+async def store_sketches(
+    conn: asyncpg.Connection, sketches: dict[SketchKey, HyperLogLog]
+):
+    """Merges ``sketches`` into the stored ones; must run inside a transaction."""
+    if not sketches:
+        return
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('video_id_sketches'))")
+    days, creators, metrics = zip(*sketches)
+    blobs: dict[SketchKey, bytes] = {}
+    for row in await conn.fetch(SELECT_EXISTING, days, creators, metrics):
+        # merge into the stored (dense) copy and serialize right away, so the
+        # new sketches stay sparse and only one dense array is alive at a time
+        key = (row["day"], row["creator_id"], row["metric"])
+        stored = HyperLogLog.from_bytes(row["registers"])
+        stored.merge(sketches[key])
+        blobs[key] = stored.to_bytes()
+    await conn.executemany(
+        UPSERT,
+        [
+            (*key, blobs[key] if key in blobs else sketch.to_bytes())
+            for key, sketch in sketches.items()
+        ],
+    )
+
+
+def sketch_query(plan: Answer) -> tuple[date, date, str, str] | None:
+    """Maps a plan to the sketches that answer it, if it is eligible.
+
+    Eligible plans count distinct ``video_id`` over snapshots of whole UTC
+    days, filtered by nothing but an optional creator and an optional
+    ``delta_* > 0``.
+    """
+    if not (
+        plan.entity == Entity.video_snapshots
+        and plan.operation == Operation.count_
+        and plan.distinct
+        and plan.field == "video_id"
+        and plan.date_filter
+    ):
+        return None
+    from_, to = plan.date_filter.from_, plan.date_filter.to
+    if from_.time() != time() or to.time() < time(23, 59, 59):
+        return None
+
+    if plan.where is None:
+        conditions = []
+    elif isinstance(plan.where, Condition):
+        conditions = [plan.where]
+    elif plan.where.op == LogicalOp.and_:
+        conditions = plan.where.conditions
+    else:
+        return None
+
+    creator_id, metric = ALL_CREATORS, ANY_METRIC
+    for c in conditions:
+        if isinstance(c, ConditionGroup):
+            return None
+        if (
+            c.field == "creator_id"
+            and c.operator == CompareOp.eq
+            and creator_id == ALL_CREATORS
+        ):
+            creator_id = str(c.value)
+        elif (
+            c.field in DELTA_METRICS
+            and (c.operator, c.value) in ((CompareOp.gt, 0), (CompareOp.gte, 1))
+            and metric == ANY_METRIC
+        ):
+            metric = c.field
+        else:
+            return None
+
+    if plan.join and not (
+        creator_id != ALL_CREATORS
+        and plan.join.source_field == "video_id"
+        and plan.join.target_entity == Entity.video
+        and plan.join.target_field == "id"
+    ):
+        return None
+    return from_.date(), to.date(), creator_id, metric
+
+
+async def approximate_distinct(
+    sessionmaker: async_sessionmaker[AsyncSession], plan: Answer
+) -> int | None:
+    """Estimates the plan's result from stored sketches.
+
+    Returns None if the plan is ineligible or if some day of the range has
+    no sketch, e.g. data loaded before sketches existed and not rebuilt
+    since; the caller then counts exactly. Every day with snapshots has an
+    overall sketch, so those rows record which days are covered; days after
+    the newest sketch have no data yet and are not required.
+    """
+    query = sketch_query(plan)
+    if query is None:
+        return None
+    from_day, to_day, creator_id, metric = query
+    overall = (VideoIdSketchOrm.creator_id == ALL_CREATORS) & (
+        VideoIdSketchOrm.metric == ANY_METRIC
+    )
+    stmt = select(
+        VideoIdSketchOrm.day,
+        VideoIdSketchOrm.creator_id,
+        VideoIdSketchOrm.metric,
+        VideoIdSketchOrm.registers,
+    ).where(
+        VideoIdSketchOrm.day >= from_day,
+        VideoIdSketchOrm.day <= to_day,
+        overall
+        | (
+            (VideoIdSketchOrm.creator_id == creator_id)
+            & (VideoIdSketchOrm.metric == metric)
+        ),
+    )
+    async with sessionmaker() as session:
+        rows = (await session.execute(stmt)).all()
+        newest = await session.scalar(
+            select(func.max(VideoIdSketchOrm.day)).where(overall)
+        )
+
+    covered = {
+        r.day for r in rows if (r.creator_id, r.metric) == (ALL_CREATORS, ANY_METRIC)
+    }
+    if not covered or len(covered) < (min(to_day, newest) - from_day).days + 1:
+        return None
+    registers = [
+        r.registers for r in rows if (r.creator_id, r.metric) == (creator_id, metric)
+    ]
+    merged = await asyncio.to_thread(HyperLogLog.union, registers)
+    return merged.estimate()
+
+
+REBUILD_SOURCE = f"""
+SELECT (s.created_at AT TIME ZONE 'UTC')::date AS day, v.creator_id, s.video_id,
+    {", ".join(f"bool_or(s.{m} > 0) AS {m}" for m in DELTA_METRICS)}
+FROM video_snapshots s
+JOIN videos v ON v.id = s.video_id
+GROUP BY 1, 2, 3
+ORDER BY 1
+"""
+
+
+async def rebuild():
+    """Recomputes all sketches from ``video_snapshots``, one day at a time."""
+    conn = await get_connection()
+    try:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM video_id_sketches")
+            sketches: dict[SketchKey, HyperLogLog] = {}
+            current: date | None = None
+            async for row in conn.cursor(REBUILD_SOURCE):
+                if row["day"] != current and sketches:
+                    await store_sketches(conn, sketches)
+                    print(f"{current}: {len(sketches)} sketches")
+                    sketches = {}
+                current = row["day"]
+                observe(
+                    sketches,
+                    row["day"],
+                    row["creator_id"],
+                    row["video_id"],
+                    [m for m in DELTA_METRICS if row[m]],
+                )
+            await store_sketches(conn, sketches)
+            if sketches:
+                print(f"{current}: {len(sketches)} sketches")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
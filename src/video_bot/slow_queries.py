@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+from collections import deque
+from datetime import UTC, datetime
+from logging import getLogger
+from time import monotonic
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from video_bot.config import get_config
+from video_bot.plan import shape_hash
+
+logger = getLogger(__name__)
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element: Explain, compiler, **kw) -> str:
+    return "EXPLAIN (ANALYZE, BUFFERS) " + compiler.process(element.stmt, **kw)
+
+
+class ShapeStats:
+    """Running totals plus a window of recent durations for one plan shape.
+
+    ``pending_*`` hold what was observed since the last flush to the store,
+    which adds them to the totals of earlier flushes and processes.
+    """
+
+    def __init__(self, window: int = 200):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent: deque[float] = deque(maxlen=window)
+        self.pending_count = 0
+        self.pending_ms = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.recent.append(elapsed_ms)
+        self.pending_count += 1
+        self.pending_ms += elapsed_ms
+
+    def take_pending(self) -> tuple[int, float]:
+        pending = self.pending_count, self.pending_ms
+        self.pending_count, self.pending_ms = 0, 0.0
+        return pending
+
+    def as_dict(self) -> dict:
+        ordered = sorted(self.recent)
+        p95 = (
+            ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else 0.0
+        )
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+            "p50_ms": round(ordered[len(ordered) // 2], 1) if ordered else 0.0,
+            "p95_ms": round(p95, 1),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+shape_stats: dict[str, ShapeStats] = {}
+# at most one EXPLAIN ANALYZE per shape, SLOW_QUERY_MAX_CAPTURES in total:
+# each one runs the slow query again on the bot's pool
+_captures: dict[str, asyncio.Task] = {}
+_flushes: set[asyncio.Task] = set()
+_last_flush = monotonic()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    captured_at TEXT NOT NULL,
+    shape_hash TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    elapsed_ms REAL NOT NULL,
+    stats TEXT NOT NULL,
+    sql TEXT NOT NULL,
+    params TEXT NOT NULL,
+    plan TEXT NOT NULL
+)
+"""
+
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shape_stats (
+    shape_hash TEXT PRIMARY KEY,
+    shape TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    p50_ms REAL NOT NULL,
+    p95_ms REAL NOT NULL,
+    updated_at TEXT NOT NULL
+)
+"""
+
+# counts and totals add up across flushes and processes; percentiles are
+# those of the latest window
+SAVE_STATS = """
+INSERT INTO shape_stats
+    (shape_hash, shape, count, total_ms, max_ms, p50_ms, p95_ms, updated_at)
+VALUES (:shape_hash, :shape, :count, :total_ms, :max_ms, :p50_ms, :p95_ms,
+    :updated_at)
+ON CONFLICT (shape_hash) DO UPDATE SET
+    count = count + excluded.count,
+    total_ms = total_ms + excluded.total_ms,
+    max_ms = max(max_ms, excluded.max_ms),
+    p50_ms = excluded.p50_ms,
+    p95_ms = excluded.p95_ms,
+    updated_at = excluded.updated_at
+"""
+
+
+def save_capture(path: str, entry: dict):
+    with sqlite3.connect(path) as db:
+        db.execute(SCHEMA)
+        db.execute(
+            "INSERT INTO slow_queries "
+            "(captured_at, shape_hash, shape, elapsed_ms, stats, sql, params, plan) "
+            "VALUES (:captured_at, :shape_hash, :shape, :elapsed_ms, :stats, :sql, "
+            ":params, :plan)",
+            entry,
+        )
+    db.close()
+
+
+def save_stats(path: str, rows: list[dict]):
+    with sqlite3.connect(path) as db:
+        db.execute(STATS_SCHEMA)
+        db.executemany(SAVE_STATS, rows)
+    db.close()
+
+
+def load_stats(path: str, limit: int) -> list[dict]:
+    """Shapes ordered by the total time spent in them."""
+    with sqlite3.connect(path) as db:
+        db.row_factory = sqlite3.Row
+        db.execute(STATS_SCHEMA)
+        rows = [
+            dict(r)
+            for r in db.execute(
+                "SELECT * FROM shape_stats ORDER BY total_ms DESC LIMIT ?", (limit,)
+            )
+        ]
+    db.close()
+    return rows
+
+
+def pending_stats() -> list[dict]:
+    rows = []
+    now = datetime.now(UTC).isoformat()
+    for shape, stats in shape_stats.items():
+        count, total_ms = stats.take_pending()
+        if not count:
+            continue
+        summary = stats.as_dict()
+        rows.append(
+            {
+                "shape_hash": shape_hash(shape),
+                "shape": shape,
+                "count": count,
+                "total_ms": round(total_ms, 1),
+                "max_ms": summary["max_ms"],
+                "p50_ms": summary["p50_ms"],
+                "p95_ms": summary["p95_ms"],
+                "updated_at": now,
+            }
+        )
+    return rows
+
+
+async def flush_stats():
+    """Adds the statistics gathered since the last flush to the store."""
+    global _last_flush
+    _last_flush = monotonic()
+    rows = pending_stats()
+    if rows:
+        await asyncio.to_thread(save_stats, get_config().SLOW_QUERY_STORE, rows)
+
+
+def load_captures(path: str, limit: int, shape: str | None = None) -> list[dict]:
+    with sqlite3.connect(path) as db:
+        db.row_factory = sqlite3.Row
+        db.execute(SCHEMA)
+        query = "SELECT * FROM slow_queries"
+        params: tuple = ()
+        if shape:
+            query += " WHERE shape_hash LIKE ?"
+            params = (f"{shape}%",)
+        query += " ORDER BY id DESC LIMIT ?"
+        rows = [dict(r) for r in db.execute(query, (*params, limit))]
+    db.close()
+    return rows
+
+
+async def capture(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    stmt,
+    shape: str,
+    elapsed_ms: float,
+):
+    # expanding IN parameters are rendered inline instead of as __[POSTCOMPILE_x]
+    compiled = stmt.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"render_postcompile": True}
+    )
+    async with sessionmaker() as session:
+        rows = (await session.execute(Explain(stmt))).scalars().all()
+    entry = {
+        "captured_at": datetime.now(UTC).isoformat(),
+        "shape_hash": shape_hash(shape),
+        "shape": shape,
+        "elapsed_ms": round(elapsed_ms, 1),
+        "stats": json.dumps(shape_stats[shape].as_dict()),
+        "sql": str(compiled),
+        "params": json.dumps(compiled.params, ensure_ascii=False, default=str),
+        "plan": "\n".join(rows),
+    }
+    await asyncio.to_thread(save_capture, get_config().SLOW_QUERY_STORE, entry)
+    logger.info(
+        "captured plan for slow shape %s (%.1f ms)", entry["shape_hash"], elapsed_ms
+    )
+
+
+def _task_done(task: asyncio.Task):
+    _flushes.discard(task)
+    for shape, capture_task in list(_captures.items()):
+        if capture_task is task:
+            del _captures[shape]
+    if not task.cancelled() and task.exception():
+        logger.warning("%s failed", task.get_name(), exc_info=task.exception())
+
+
+def observe_query(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    stmt,
+    shape: str,
+    elapsed_ms: float,
+):
+    """Updates per-shape statistics and samples slow queries for EXPLAIN.
+
+    The EXPLAIN (ANALYZE, BUFFERS) re-run happens in a background task so
+    the user's reply does not wait for it. A shape that is already being
+    captured, or a full set of running captures, skips the sample. The
+    statistics are flushed to the store every SLOW_QUERY_FLUSH_INTERVAL
+    seconds.
+    """
+    shape_stats.setdefault(shape, ShapeStats()).observe(elapsed_ms)
+    config = get_config()
+    if monotonic() - _last_flush >= config.SLOW_QUERY_FLUSH_INTERVAL and not _flushes:
+        task = asyncio.create_task(flush_stats(), name="slow query stats flush")
+        _flushes.add(task)
+        task.add_done_callback(_task_done)
+    if elapsed_ms < config.SLOW_QUERY_THRESHOLD_MS:
+        return
+    if random.random() >= config.SLOW_QUERY_SAMPLE_RATE:
+        return
+    if shape in _captures or len(_captures) >= config.SLOW_QUERY_MAX_CAPTURES:
+        return
+    task = asyncio.create_task(
+        capture(sessionmaker, stmt, shape, elapsed_ms), name="slow query capture"
+    )
+    _captures[shape] = task
+    task.add_done_callback(_task_done)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List captured slow query plans")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--shape", help="shape hash prefix")
+    parser.add_argument("--plans", action="store_true", help="print EXPLAIN output")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="list all shapes by total time instead of captured plans",
+    )
+    args = parser.parse_args()
+
+    if args.stats:
+        for row in load_stats(get_config().SLOW_QUERY_STORE, args.limit):
+            mean_ms = row["total_ms"] / row["count"] if row["count"] else 0.0
+            print(
+                f"{row['shape_hash']} count={row['count']} "
+                f"total={row['total_ms']:.0f}ms mean={mean_ms:.1f}ms "
+                f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms max={row['max_ms']}ms "
+                f"updated={row['updated_at']}"
+            )
+            print(f"  shape: {row['shape']}")
+        return
+
+    entries = load_captures(get_config().SLOW_QUERY_STORE, args.limit, args.shape)
+    for entry in entries:
+        stats = json.loads(entry["stats"])
+        print(
+            f"#{entry['id']} {entry['captured_at']} shape={entry['shape_hash']} "
+            f"elapsed={entry['elapsed_ms']}ms count={stats['count']} "
+            f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms max={stats['max_ms']}ms"
+        )
+        print(f"  shape: {entry['shape']}")
+        print(f"  sql: {' '.join(entry['sql'].split())}")
+        print(f"  params: {entry['params']}")
+        if args.plans:
+            for line in entry["plan"].splitlines():
+                print(f"    {line}")
+
+
+if __name__ == "__main__":
+    main()
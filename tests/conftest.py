@@ -0,0 +1,14 @@
+import os
+
+# required settings; tests never reach Telegram, OpenAI or Postgres
+for name, value in {
+    "BOT_TOKEN": "1:test",
+    "OPENAI_KEY": "test",
+    "OPENAI_URL": "http://127.0.0.1:9/v1",
+    "DB_HOST": "127.0.0.1",
+    "DB_PORT": "5432",
+    "DB_NAME": "video_bot",
+    "DB_USER": "postgres",
+    "DB_PASS": "postgres",
+}.items():
+    os.environ.setdefault(name, value)
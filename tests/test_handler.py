@@ -0,0 +1,262 @@
+import asyncio
+from time import perf_counter
+
+import pytest
+from openai import AsyncOpenAI
+
+from video_bot import handler
+from video_bot.answer import Answer
+from video_bot.loadtest.fake_openai import DEFAULT_PLAN, FakeOpenAI
+from video_bot.plan import canonicalize
+
+PLAN_A = Answer.model_validate(DEFAULT_PLAN)
+PLAN_B = Answer.model_validate({**DEFAULT_PLAN, "distinct": False})
+
+
+class ScriptedLLM:
+    """Stands in for ``request_answer``: each call sleeps, then returns or raises."""
+
+    def __init__(self, *steps: tuple[float, object]):
+        self.steps = steps
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, text: str):
+        delay, outcome = self.steps[self.calls]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def ask(monkeypatch, llm: ScriptedLLM, delay: float | None):
+    monkeypatch.setattr(handler, "request_answer", llm)
+    monkeypatch.setattr(handler, "hedge_delay", lambda: delay)
+
+    async def run():
+        started = perf_counter()
+        answer = await handler.get_answer("question")
+        elapsed = perf_counter() - started
+        # let cancellations of the losing request land, but read the counters
+        # before asyncio.run() cancels whatever is still running
+        await asyncio.sleep(0.01)
+        return answer, elapsed, llm.calls, llm.cancelled
+
+    return asyncio.run(run())
+
+
+def test_without_hedging_retries_after_an_invalid_answer(monkeypatch):
+    llm = ScriptedLLM((0.01, None), (0.01, PLAN_A))
+    answer, _, calls, cancelled = ask(monkeypatch, llm, None)
+    assert answer == PLAN_A
+    assert calls == 2
+
+
+def test_without_hedging_a_slow_answer_is_awaited(monkeypatch):
+    llm = ScriptedLLM((0.2, PLAN_A), (0.01, PLAN_B))
+    answer, elapsed, calls, cancelled = ask(monkeypatch, llm, None)
+    assert answer == PLAN_A
+    assert calls == 1
+    assert elapsed >= 0.2
+
+
+def test_hedge_fires_after_the_delay_and_cancels_the_loser(monkeypatch):
+    llm = ScriptedLLM((2.0, PLAN_A), (0.01, PLAN_B))
+    answer, elapsed, calls, cancelled = ask(monkeypatch, llm, 0.05)
+    assert answer == PLAN_B
+    assert calls == 2
+    assert cancelled == 1
+    assert 0.05 <= elapsed < 1.0
+
+
+def test_first_request_can_still_win_after_hedging(monkeypatch):
+    llm = ScriptedLLM((0.1, PLAN_A), (2.0, PLAN_B))
+    answer, elapsed, calls, cancelled = ask(monkeypatch, llm, 0.05)
+    assert answer == PLAN_A
+    assert calls == 2
+    assert cancelled == 1
+    assert elapsed < 1.0
+
+
+def test_no_hedge_when_the_first_answer_is_fast(monkeypatch):
+    llm = ScriptedLLM((0.01, PLAN_A), (0.01, PLAN_B))
+    answer, _, calls, cancelled = ask(monkeypatch, llm, 0.5)
+    assert answer == PLAN_A
+    assert calls == 1
+
+
+@pytest.mark.parametrize("delay", [None, 0.05])
+def test_failed_attempt_falls_through_to_the_other(monkeypatch, delay):
+    llm = ScriptedLLM((0.01, RuntimeError("llm down")), (0.01, PLAN_A))
+    answer, _, calls, cancelled = ask(monkeypatch, llm, delay)
+    assert answer == PLAN_A
+    assert calls == 2
+
+
+@pytest.mark.parametrize("delay", [None, 0.05])
+def test_all_attempts_failing_gives_none(monkeypatch, delay):
+    llm = ScriptedLLM((0.01, RuntimeError("llm down")), (0.01, None))
+    answer, _, calls, cancelled = ask(monkeypatch, llm, delay)
+    assert answer is None
+    assert calls == handler.LLM_ATTEMPTS
+
+
+def ask_fake_server(monkeypatch, latency: float, delay: float | None):
+    monkeypatch.setattr(handler, "hedge_delay", lambda: delay)
+
+    async def run():
+        fake = FakeOpenAI({}, latency=latency, chunk_size=5)
+        url = await fake.start()
+        monkeypatch.setattr(handler, "_client", AsyncOpenAI(base_url=url, api_key="x"))
+        try:
+            started = perf_counter()
+            answer = await handler.get_answer("question")
+            return answer, perf_counter() - started, fake.calls
+        finally:
+            await fake.stop()
+
+    return asyncio.run(run())
+
+
+def test_streamed_answer_from_fake_server(monkeypatch):
+    answer, elapsed, calls = ask_fake_server(monkeypatch, 0.1, None)
+    assert answer == canonicalize(PLAN_A)
+    assert calls == 1
+    assert elapsed >= 0.1
+
+
+def test_hedged_request_to_fake_server(monkeypatch):
+    answer, elapsed, calls = ask_fake_server(monkeypatch, 0.3, 0.05)
+    assert answer == canonicalize(PLAN_A)
+    assert calls == 2
+    assert elapsed < 1.0
+
+
+def test_hedge_delay_follows_observed_latency(monkeypatch):
+    config = handler.get_config()
+    monkeypatch.setattr(config, "LLM_HEDGE", True)
+    monkeypatch.setattr(config, "LLM_HEDGE_QUANTILE", 0.5)
+    monkeypatch.setattr(config, "LLM_HEDGE_DEFAULT_DELAY", 3.0)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_DELAY", 0.5)
+    tracker = handler.LatencyTracker(min_samples=3)
+    monkeypatch.setattr(handler, "llm_latency", tracker)
+
+    assert handler.hedge_delay() == 3.0
+    for seconds in (0.1, 2.0, 2.0):
+        tracker.observe(seconds)
+    assert handler.hedge_delay() == 2.0
+    for seconds in (0.1, 0.1, 0.1):
+        tracker.observe(seconds)
+    assert handler.hedge_delay() == 0.5
+
+    monkeypatch.setattr(config, "LLM_HEDGE", False)
+    assert handler.hedge_delay() is None
+
+
+def test_split_questions_skips_blank_lines():
+    assert handler.split_questions("  first \n\n\t\nsecond\n") == ["first", "second"]
+    assert handler.split_questions(" \n ") == []
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.chat = self.from_user = type("Chat", (), {"id": 1})()
+        self.message_id = 1
+        self.answers: list[str] = []
+
+    async def answer(self, text: str):
+        self.answers.append(text)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [("one", "reply to one"), ("one\n\ntwo", "1. reply to one\n2. reply to two")],
+)
+def test_handler_numbers_replies_to_several_questions(monkeypatch, text, expected):
+    async def get_answer(question: str):
+        return question
+
+    async def get_replies(sessionmaker, answers):
+        return [f"reply to {a}" for a in answers]
+
+    monkeypatch.setattr(handler, "get_answer", get_answer)
+    monkeypatch.setattr(handler, "get_replies", get_replies)
+    message = FakeMessage(text)
+    asyncio.run(handler.handler(message, None))
+    assert message.answers == [expected]
+
+
+class FailingSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        raise RuntimeError("combined statement failed")
+
+
+def replies_with(monkeypatch, answers, values: dict, approximations=None):
+    """Runs ``get_replies`` with the combined SELECT failing.
+
+    Each plan then goes through ``get_data``, which returns or raises the
+    outcome given for it in ``values``.
+    """
+    config = handler.get_config()
+    monkeypatch.setattr(config, "APPROXIMATE_DISTINCT", approximations is not None)
+
+    async def get_data(sessionmaker, answer):
+        outcome = values[answer.distinct]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def approximate_distinct(sessionmaker, answer):
+        await asyncio.sleep(0.1)
+        outcome = approximations[answer.distinct]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(handler, "get_data", get_data)
+    monkeypatch.setattr(handler, "approximate_distinct", approximate_distinct)
+
+    async def run():
+        started = perf_counter()
+        replies = await handler.get_replies(FailingSession, answers)
+        return replies, perf_counter() - started
+
+    return asyncio.run(run())
+
+
+def test_batched_failure_falls_back_to_each_plan(monkeypatch):
+    replies, _ = replies_with(
+        monkeypatch,
+        [PLAN_A, None, PLAN_B],
+        {True: 7, False: ValueError("bad plan")},
+    )
+    assert replies == ["7", "Некорректный запрос", "Некорректный запрос"]
+
+
+def test_single_failing_plan_gives_an_error_reply(monkeypatch):
+    replies, _ = replies_with(monkeypatch, [PLAN_A], {True: ValueError("bad plan")})
+    assert replies == ["Некорректный запрос"]
+
+
+def test_approximations_run_concurrently_and_fall_back(monkeypatch):
+    replies, elapsed = replies_with(
+        monkeypatch,
+        [PLAN_A, PLAN_B, PLAN_A],
+        {True: 7, False: 3},
+        {True: 100, False: RuntimeError("sketch store unavailable")},
+    )
+    assert replies[0].startswith("≈100 ") and replies[2] == replies[0]
+    assert replies[1] == "3"
+    assert elapsed < 0.25
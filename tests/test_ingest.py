@@ -0,0 +1,157 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+from video_bot import ingest
+from video_bot.ingest import Batch, Metrics, file_key, quarantine, read_stdin
+from video_bot.loadtest.synthetic import generate_videos
+
+END = datetime(2026, 1, 2, tzinfo=UTC)
+
+
+def stdin_batches(monkeypatch, lines: list[str], batch_size: int):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("".join(lines)))
+    metrics = Metrics()
+
+    async def run():
+        queue: asyncio.Queue = asyncio.Queue()
+        await read_stdin(queue, metrics, batch_size, flush_interval=5.0)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    return asyncio.run(run()), metrics
+
+
+def test_read_stdin_batches_and_skips_bad_lines(monkeypatch):
+    videos = generate_videos(3, 1, 1, end=END)
+    broken = {**videos[0], "snapshots": [{"id": "no counters"}]}
+    lines = [
+        json.dumps(videos[0]) + "\n",
+        "{not json\n",
+        "\n",
+        json.dumps(videos[1]) + "\n",
+        json.dumps(broken) + "\n",
+        json.dumps(videos[2]),
+    ]
+    batches, metrics = stdin_batches(monkeypatch, lines, batch_size=2)
+    assert [b.videos for b in batches] == [videos[:2], videos[2:]]
+    assert all(b.path is None and b.key is None for b in batches)
+    assert metrics.skipped_lines == 2
+
+
+def test_read_stdin_flushes_after_idling(monkeypatch):
+    video = generate_videos(1, 1, 1, end=END)[0]
+    readline_calls = []
+
+    def readline():
+        readline_calls.append(None)
+        if len(readline_calls) == 1:
+            return json.dumps(video) + "\n"
+        # the writer has gone quiet for longer than the flush interval
+        if len(readline_calls) == 2:
+            time.sleep(0.1)
+        return ""
+
+    monkeypatch.setattr(sys, "stdin", SimpleNamespace(readline=readline))
+    metrics = Metrics()
+
+    async def run():
+        queue: asyncio.Queue = asyncio.Queue()
+        reader = asyncio.create_task(read_stdin(queue, metrics, 100, 0.02))
+        first = await asyncio.wait_for(queue.get(), 1.0)
+        await reader
+        return first, queue.qsize()
+
+    first, left = asyncio.run(run())
+    assert first.videos == [video]
+    assert left == 0
+
+
+def test_quarantine_moves_the_file_out(tmp_path):
+    path = tmp_path / "batch.json"
+    path.write_text("{}")
+    key = file_key(path)
+    seen = {key}
+    metrics = Metrics()
+    quarantine(path, key, metrics, seen)
+    assert not path.exists()
+    assert (tmp_path / ingest.QUARANTINE_DIR / "batch.json").read_text() == "{}"
+    assert metrics.quarantined_files == 1
+    assert seen == set()
+
+
+def test_quarantine_failure_keeps_the_file_seen(tmp_path):
+    # a regular file where the quarantine directory should be
+    (tmp_path / ingest.QUARANTINE_DIR).write_text("")
+    path = tmp_path / "batch.json"
+    path.write_text("{}")
+    key = file_key(path)
+    seen = {key}
+    metrics = Metrics()
+    quarantine(path, key, metrics, seen)
+    assert path.exists()
+    assert metrics.quarantined_files == 0
+    assert seen == {key}
+
+
+def watch_once(directory, seen) -> list[Batch]:
+    async def run():
+        queue: asyncio.Queue = asyncio.Queue()
+        watcher = asyncio.create_task(
+            ingest.watch_directory(directory, queue, Metrics(), seen, 0.01)
+        )
+        await asyncio.sleep(0.1)
+        watcher.cancel()
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    return asyncio.run(run())
+
+
+def test_watch_reloads_a_file_replaced_under_the_same_name(tmp_path):
+    videos = generate_videos(2, 1, 1, end=END)
+    path = tmp_path / "batch.json"
+    path.write_text(json.dumps({"videos": videos[:1]}))
+    (tmp_path / "notes.txt").write_text("ignored")
+    seen: set = set()
+
+    [batch] = watch_once(tmp_path, seen)
+    assert batch.videos == videos[:1]
+    assert batch.key == file_key(path)
+    assert watch_once(tmp_path, seen) == []
+
+    path.write_text(json.dumps({"videos": videos}))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    [batch] = watch_once(tmp_path, seen)
+    assert batch.videos == videos
+
+
+def test_watch_quarantines_unparsable_files(tmp_path):
+    (tmp_path / "broken.json").write_text("{not json")
+    seen: set = set()
+    assert watch_once(tmp_path, seen) == []
+    assert (tmp_path / ingest.QUARANTINE_DIR / "broken.json").exists()
+    assert seen == set()
+
+
+def test_metrics_render():
+    metrics = Metrics()
+    metrics.files = 2
+    metrics.skipped_lines = 3
+    metrics.last_batch_seconds = 0.25
+    metrics.queue = asyncio.Queue()
+    metrics.queue.put_nowait(Batch(None, []))
+    lines = dict(line.split(" ") for line in metrics.render().splitlines())
+    assert lines["video_bot_ingest_files_total"] == "2"
+    assert lines["video_bot_ingest_skipped_lines_total"] == "3"
+    assert lines["video_bot_ingest_last_batch_seconds"] == "0.25"
+    assert lines["video_bot_ingest_queue_depth"] == "1"
+    assert "video_bot_ingest_freshness_lag_seconds" not in lines
+
+    metrics.latest_snapshot = datetime.now(UTC) - timedelta(minutes=5)
+    lines = dict(line.split(" ") for line in metrics.render().splitlines())
+    assert 299 <= float(lines["video_bot_ingest_freshness_lag_seconds"]) < 310
@@ -0,0 +1,69 @@
+import json
+
+from video_bot.llm import JsonObjectScanner, LatencyTracker
+
+
+def feed_all(chunks: list[str]) -> str | None:
+    scanner = JsonObjectScanner()
+    for chunk in chunks:
+        obj = scanner.feed(chunk)
+        if obj is not None:
+            return obj
+    return None
+
+
+def test_scanner_ignores_braces_inside_strings():
+    text = '{"a": "}{", "b": {"c": "{"}}'
+    assert feed_all([text]) == text
+
+
+def test_scanner_handles_escaped_quotes():
+    text = r'{"a": "say \"}\" and \\", "b": 1}'
+    obj = feed_all([text])
+    assert obj == text
+    assert json.loads(obj) == {"a": 'say "}" and \\', "b": 1}
+
+
+def test_scanner_completes_objects_split_across_chunks():
+    text = '{"a": {"b": "x\\"}"}, "c": [1, 2]}'
+    for size in range(1, len(text) + 1):
+        chunks = [text[i : i + size] for i in range(0, len(text), size)]
+        assert feed_all(chunks) == text
+
+
+def test_scanner_skips_text_around_the_object():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('Here is "the" plan: {"a"') is None
+    assert scanner.feed(': 1} and some "trailing" {text}') == '{"a": 1}'
+
+
+def test_scanner_waits_for_an_unfinished_object():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"a": {"b": 1}') is None
+    assert scanner.text == '{"a": {"b": 1}'
+
+
+def test_latency_tracker_needs_min_samples():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.observe(1.0)
+    tracker.observe(2.0)
+    assert tracker.quantile(0.5) is None
+    tracker.observe(3.0)
+    assert tracker.quantile(0.5) == 2.0
+
+
+def test_latency_tracker_quantiles():
+    tracker = LatencyTracker(min_samples=1)
+    for value in reversed(range(1, 101)):
+        tracker.observe(float(value))
+    assert tracker.quantile(0.0) == 1.0
+    assert tracker.quantile(0.5) == 51.0
+    assert tracker.quantile(0.95) == 96.0
+    assert tracker.quantile(1.0) == 100.0
+
+
+def test_latency_tracker_keeps_a_rolling_window():
+    tracker = LatencyTracker(size=3, min_samples=1)
+    for value in (100.0, 1.0, 2.0, 3.0):
+        tracker.observe(value)
+    assert tracker.quantile(1.0) == 3.0
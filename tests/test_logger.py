@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+from logging.handlers import QueueListener
+from queue import SimpleQueue
+
+from video_bot.logger import (
+    JsonFormatter,
+    PayloadSamplingFilter,
+    RequestContextFilter,
+    StructuredQueueHandler,
+    request_id_var,
+)
+
+
+def log_through_queue(emit) -> list[dict]:
+    stream = io.StringIO()
+    sink = logging.StreamHandler(stream)
+    sink.setFormatter(JsonFormatter())
+    handler = StructuredQueueHandler(SimpleQueue())
+    handler.addFilter(RequestContextFilter())
+    listener = QueueListener(handler.queue, sink)
+
+    logger = logging.getLogger("tests.logger")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+    listener.start()
+    try:
+        emit(logger)
+    finally:
+        listener.stop()
+        logger.handlers = []
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_queued_record_keeps_context_and_separate_traceback():
+    def emit(logger):
+        token = request_id_var.set("42:7")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.error(
+                "failed %s", "plan", exc_info=True, extra={"timings": {"llm": 0.5}}
+            )
+        finally:
+            request_id_var.reset(token)
+
+    [entry] = log_through_queue(emit)
+    assert entry["message"] == "failed plan"
+    assert entry["level"] == "ERROR"
+    assert entry["request_id"] == "42:7"
+    assert entry["timings"] == {"llm": 0.5}
+    assert "Traceback" in entry["exc"]
+    assert "ValueError: boom" in entry["exc"]
+    assert "Traceback" not in entry["message"]
+
+
+def test_record_without_context_has_no_optional_fields():
+    [entry] = log_through_queue(lambda logger: logger.info("plain"))
+    assert entry["message"] == "plain"
+    assert not {"request_id", "timings", "exc"} & entry.keys()
+
+
+def make_record(payload: bool) -> logging.LogRecord:
+    record = logging.LogRecord("t", logging.INFO, __file__, 1, "msg", None, None)
+    if payload:
+        record.payload = True
+    return record
+
+
+def test_payload_sampling_drops_everything_at_rate_zero():
+    sampler = PayloadSamplingFilter(0.0)
+    assert not any(sampler.filter(make_record(True)) for _ in range(100))
+    assert sampler.filter(make_record(False))
+
+
+def test_payload_sampling_keeps_everything_at_rate_one():
+    sampler = PayloadSamplingFilter(1.0)
+    assert all(sampler.filter(make_record(True)) for _ in range(100))
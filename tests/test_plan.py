@@ -0,0 +1,148 @@
+import itertools
+import operator
+
+from hypothesis import example, given, settings
+from hypothesis import strategies as st
+
+from video_bot.answer import Answer, CompareOp, Condition, ConditionGroup, LogicalOp
+from video_bot.plan import canonicalize, plan_hash, plan_shape
+
+INT_FIELDS = ["views_count", "likes_count"]
+VIDEO_IDS = ["a", "b", "c"]
+
+COMPARE = {
+    CompareOp.eq: operator.eq,
+    CompareOp.ne: operator.ne,
+    CompareOp.gt: operator.gt,
+    CompareOp.gte: operator.ge,
+    CompareOp.lt: operator.lt,
+    CompareOp.lte: operator.le,
+    CompareOp.in_: lambda left, right: left in right,
+}
+
+int_values = st.integers(min_value=0, max_value=2)
+
+int_conditions = st.builds(
+    Condition,
+    field=st.sampled_from(INT_FIELDS),
+    operator=st.sampled_from([op for op in CompareOp if op != CompareOp.in_]),
+    value=int_values,
+) | st.builds(
+    Condition,
+    field=st.sampled_from(INT_FIELDS),
+    operator=st.just(CompareOp.in_),
+    value=st.lists(int_values, min_size=1, max_size=4),
+)
+
+str_conditions = st.builds(
+    Condition,
+    field=st.just("video_id"),
+    operator=st.sampled_from([CompareOp.eq, CompareOp.ne]),
+    value=st.sampled_from(VIDEO_IDS),
+) | st.builds(
+    Condition,
+    field=st.just("video_id"),
+    operator=st.just(CompareOp.in_),
+    value=st.lists(st.sampled_from(VIDEO_IDS), min_size=1, max_size=3),
+)
+
+filters = st.recursive(
+    int_conditions | str_conditions,
+    lambda children: st.builds(
+        ConditionGroup,
+        op=st.sampled_from(LogicalOp),
+        conditions=st.lists(children, min_size=1, max_size=4),
+    ),
+    max_leaves=12,
+)
+
+# every row the generated conditions can tell apart, plus values outside them
+ROWS = [
+    {"views_count": views, "likes_count": likes, "video_id": video_id}
+    for views, likes, video_id in itertools.product(
+        range(-1, 4), range(-1, 4), VIDEO_IDS + ["d"]
+    )
+]
+
+
+def make_plan(where) -> Answer:
+    return Answer(
+        entity="video_snapshots",
+        operation="sum",
+        field="delta_views_count",
+        distinct=False,
+        where=where,
+    )
+
+
+def evaluate(node, row: dict) -> bool:
+    if isinstance(node, Condition):
+        return COMPARE[node.operator](row[node.field], node.value)
+    results = (evaluate(c, row) for c in node.conditions)
+    return all(results) if node.op == LogicalOp.and_ else any(results)
+
+
+@st.composite
+def equivalent(draw, node):
+    """Rewrites a filter by shuffling, duplicating and wrapping its nodes."""
+    if isinstance(node, ConditionGroup):
+        children = [draw(equivalent(c)) for c in node.conditions]
+        if draw(st.booleans()):
+            children.append(draw(st.sampled_from(children)))
+        node = ConditionGroup(op=node.op, conditions=draw(st.permutations(children)))
+    if draw(st.booleans()):
+        node = ConditionGroup(op=draw(st.sampled_from(LogicalOp)), conditions=[node])
+    return node
+
+
+def bounds(*conditions: tuple[str, int]) -> ConditionGroup:
+    return ConditionGroup(
+        op=LogicalOp.and_,
+        conditions=[
+            Condition(field="views_count", operator=op, value=value)
+            for op, value in conditions
+        ],
+    )
+
+
+@settings(max_examples=1000)
+@given(filters)
+@example(bounds((">", 1), (">=", 1)))
+@example(bounds(("<", 1), ("<=", 1)))
+@example(bounds((">=", 1), ("<=", 1)))
+@example(bounds((">=", 1), ("<=", 2)))
+def test_canonicalize_preserves_semantics(where):
+    canonical = canonicalize(make_plan(where)).where
+    for row in ROWS:
+        assert evaluate(canonical, row) == evaluate(where, row)
+
+
+@given(filters)
+def test_canonicalize_is_idempotent(where):
+    canonical = canonicalize(make_plan(where))
+    assert canonicalize(canonical) == canonical
+
+
+@given(st.data())
+def test_plan_hash_is_stable_for_equivalent_plans(data):
+    where = data.draw(filters)
+    rewritten = data.draw(equivalent(where))
+    assert plan_hash(canonicalize(make_plan(rewritten))) == plan_hash(
+        canonicalize(make_plan(where))
+    )
+
+
+@given(st.data())
+def test_plan_shape_is_stable_for_equivalent_plans(data):
+    where = data.draw(filters)
+    rewritten = data.draw(equivalent(where))
+    assert plan_shape(canonicalize(make_plan(rewritten))) == plan_shape(
+        canonicalize(make_plan(where))
+    )
+
+
+def test_plan_shape_strips_values():
+    shape = plan_shape(make_plan(bounds((">", 1), ("<", 100))))
+    assert shape == plan_shape(make_plan(bounds((">", 5), ("<", 7))))
+    assert "100" not in shape
+    assert shape != plan_shape(make_plan(bounds((">", 1), (">=", 100))))
@@ -0,0 +1,226 @@
+import math
+import random
+
+import pytest
+
+from video_bot.answer import Answer
+from video_bot.sketch import (
+    ALL_CREATORS,
+    ANY_METRIC,
+    RELATIVE_ERROR,
+    SPARSE_LIMIT,
+    HyperLogLog,
+    sketch_query,
+)
+
+# the reply promises +-2 standard errors with ~95% probability
+CLAIMED_ERROR = 2 * RELATIVE_ERROR
+SEEDS = 20
+
+
+def sketch_of(values) -> HyperLogLog:
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def video_ids(n: int, prefix: str = "v") -> list[str]:
+    return [f"{prefix}-{i}" for i in range(n)]
+
+
+@pytest.mark.parametrize("n", [1, 10, 50])
+def test_tiny_cardinalities_are_exact(n):
+    assert sketch_of(video_ids(n)).estimate() == n
+
+
+# 10_000 sits where the classic estimator switches from linear counting
+@pytest.mark.parametrize("n", [300, 3_000, 10_000, 40_000])
+def test_estimate_is_within_claimed_error(n):
+    # the hash is deterministic, so these samples are fixed, not flaky
+    errors = [
+        (sketch_of(video_ids(n, prefix=f"s{seed}")).estimate() - n) / n
+        for seed in range(SEEDS)
+    ]
+    rms = math.sqrt(sum(e * e for e in errors) / len(errors))
+    within = sum(abs(e) <= CLAIMED_ERROR for e in errors)
+    assert rms <= 1.15 * RELATIVE_ERROR
+    assert abs(sum(errors) / len(errors)) <= RELATIVE_ERROR
+    assert within >= 0.85 * len(errors)
+
+
+def test_duplicates_do_not_change_the_estimate():
+    values = video_ids(3_000)
+    assert sketch_of(values * 3).estimate() == sketch_of(values).estimate()
+
+
+def test_empty_sketch_estimates_zero():
+    assert HyperLogLog().estimate() == 0
+    assert HyperLogLog.union([]).estimate() == 0
+
+
+@pytest.mark.parametrize("n", [0, 50, SPARSE_LIMIT * 4])
+def test_bytes_round_trip(n):
+    sketch = sketch_of(video_ids(n))
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.estimate() == sketch.estimate()
+    assert restored.to_bytes() == sketch.to_bytes()
+
+
+def test_serializing_keeps_small_sketches_sparse():
+    sketch = sketch_of(video_ids(50))
+    sketch.to_bytes()
+    assert sketch._sparse is not None
+    assert sketch._dense is None
+
+
+def test_merge_and_union_agree():
+    rng = random.Random(7)
+    parts = [
+        sketch_of(video_ids(rng.choice([5, 200, 3_000]), prefix=f"p{i % 4}"))
+        for i in range(12)
+    ]
+
+    merged = HyperLogLog()
+    for part in parts:
+        merged.merge(part)
+    union = HyperLogLog.union([p.to_bytes() for p in parts])
+
+    assert union.to_bytes() == merged.to_bytes()
+    assert union.estimate() == merged.estimate()
+
+
+def test_merge_equals_a_sketch_of_all_values():
+    a, b = video_ids(400, "a"), video_ids(4_000, "b")
+    for left, right in ((a, b), (b, a), (a, a)):
+        merged = sketch_of(left)
+        merged.merge(sketch_of(right))
+        assert merged.to_bytes() == sketch_of(left + right).to_bytes()
+
+
+def distinct_videos(
+    where=None,
+    join=False,
+    from_="2025-11-01T00:00:00",
+    to="2025-11-05T23:59:59",
+    **overrides,
+) -> Answer:
+    plan = {
+        "entity": "video_snapshots",
+        "operation": "count",
+        "field": "video_id",
+        "distinct": True,
+        "where": where,
+        "date_filter": {"from": from_, "to": to},
+        **overrides,
+    }
+    if join:
+        plan["join"] = {
+            "source_field": "video_id",
+            "target_entity": "video",
+            "target_field": "id",
+        }
+    return Answer.model_validate(plan)
+
+
+def condition(field, operator, value) -> dict:
+    return {"type": "condition", "field": field, "operator": operator, "value": value}
+
+
+def test_whole_days_without_filters_are_eligible():
+    query = sketch_query(distinct_videos())
+    assert query is not None
+    from_day, to_day, creator_id, metric = query
+    assert (str(from_day), str(to_day)) == ("2025-11-01", "2025-11-05")
+    assert (creator_id, metric) == (ALL_CREATORS, ANY_METRIC)
+
+
+@pytest.mark.parametrize(
+    "from_, to",
+    [
+        ("2025-11-01T12:00:00", "2025-11-05T23:59:59"),
+        ("2025-11-01T00:00:00", "2025-11-05T12:00:00"),
+    ],
+)
+def test_partial_days_are_not_eligible(from_, to):
+    assert sketch_query(distinct_videos(from_=from_, to=to)) is None
+
+
+def test_missing_date_filter_or_other_aggregates_are_not_eligible():
+    assert sketch_query(distinct_videos(date_filter=None)) is None
+    assert sketch_query(distinct_videos(distinct=False)) is None
+
+
+@pytest.mark.parametrize(
+    "where",
+    [
+        condition("delta_views_count", ">", 0),
+        condition("delta_views_count", ">=", 1),
+        {
+            "type": "group",
+            "op": "and",
+            "conditions": [condition("delta_views_count", ">=", 1)],
+        },
+    ],
+)
+def test_positive_delta_filters_pick_the_metric(where):
+    query = sketch_query(distinct_videos(where=where))
+    assert query is not None
+    assert query[2:] == (ALL_CREATORS, "delta_views_count")
+
+
+@pytest.mark.parametrize(
+    "where",
+    [
+        condition("delta_views_count", ">", 1),
+        condition("delta_views_count", ">=", 2),
+        condition("delta_views_count", "<", 0),
+        condition("views_count", ">", 0),
+    ],
+)
+def test_other_value_filters_are_not_eligible(where):
+    assert sketch_query(distinct_videos(where=where)) is None
+
+
+def test_or_groups_are_not_eligible():
+    where = {
+        "type": "group",
+        "op": "or",
+        "conditions": [
+            condition("delta_views_count", ">", 0),
+            condition("delta_likes_count", ">", 0),
+        ],
+    }
+    assert sketch_query(distinct_videos(where=where)) is None
+
+
+def test_two_delta_metrics_are_not_eligible():
+    where = {
+        "type": "group",
+        "op": "and",
+        "conditions": [
+            condition("delta_views_count", ">", 0),
+            condition("delta_likes_count", ">", 0),
+        ],
+    }
+    assert sketch_query(distinct_videos(where=where)) is None
+
+
+def test_creator_filter_through_the_join_is_eligible():
+    where = {
+        "type": "group",
+        "op": "and",
+        "conditions": [
+            condition("creator_id", "=", "c1"),
+            condition("delta_likes_count", ">=", 1),
+        ],
+    }
+    query = sketch_query(distinct_videos(where=where, join=True))
+    assert query is not None
+    assert query[2:] == ("c1", "delta_likes_count")
+
+
+def test_join_without_creator_filter_is_not_eligible():
+    assert sketch_query(distinct_videos(join=True)) is None
+    where = condition("delta_views_count", ">", 0)
+    assert sketch_query(distinct_videos(where=where, join=True)) is None
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from video_bot import slow_queries
+from video_bot.config import get_config
+from video_bot.slow_queries import ShapeStats, load_stats, save_stats
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    config = get_config()
+    path = str(tmp_path / "slow.db")
+    monkeypatch.setattr(config, "SLOW_QUERY_STORE", path)
+    monkeypatch.setattr(config, "SLOW_QUERY_THRESHOLD_MS", 100)
+    monkeypatch.setattr(config, "SLOW_QUERY_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(config, "SLOW_QUERY_MAX_CAPTURES", 2)
+    monkeypatch.setattr(config, "SLOW_QUERY_FLUSH_INTERVAL", 3600.0)
+    monkeypatch.setattr(slow_queries, "shape_stats", {})
+    monkeypatch.setattr(slow_queries, "_captures", {})
+    monkeypatch.setattr(slow_queries, "_flushes", set())
+    return path
+
+
+def test_shape_stats_summary():
+    stats = ShapeStats(window=4)
+    for elapsed in [10.0, 50.0, 20.0, 30.0, 40.0]:
+        stats.observe(elapsed)
+    assert stats.as_dict() == {
+        "count": 5,
+        "mean_ms": 30.0,
+        "p50_ms": 40.0,
+        "p95_ms": 50.0,
+        "max_ms": 50.0,
+    }
+    # the window keeps only the last four durations, totals keep everything
+    assert list(stats.recent) == [50.0, 20.0, 30.0, 40.0]
+
+
+def test_shape_stats_pending_resets_on_take():
+    stats = ShapeStats()
+    assert stats.as_dict()["p95_ms"] == 0.0
+    stats.observe(10.0)
+    stats.observe(5.0)
+    assert stats.take_pending() == (2, 15.0)
+    assert stats.take_pending() == (0, 0.0)
+    stats.observe(1.0)
+    assert stats.take_pending() == (1, 1.0)
+    assert stats.count == 3
+
+
+def test_flush_adds_to_stored_stats(store):
+    async def scenario():
+        for elapsed in [10.0, 30.0]:
+            slow_queries.observe_query(None, None, "shape-a", elapsed)
+        slow_queries.observe_query(None, None, "shape-b", 5.0)
+        await slow_queries.flush_stats()
+        slow_queries.observe_query(None, None, "shape-a", 50.0)
+        await slow_queries.flush_stats()
+        # nothing new: the stored rows stay as they are
+        await slow_queries.flush_stats()
+
+    asyncio.run(scenario())
+    rows = {row["shape"]: row for row in load_stats(store, 10)}
+    assert rows["shape-a"]["count"] == 3
+    assert rows["shape-a"]["total_ms"] == 90.0
+    assert rows["shape-a"]["max_ms"] == 50.0
+    assert rows["shape-b"]["count"] == 1
+    # ordered by total time
+    assert [row["shape"] for row in load_stats(store, 10)] == ["shape-a", "shape-b"]
+
+
+def test_stats_accumulate_across_processes(tmp_path):
+    path = str(tmp_path / "slow.db")
+    row = {
+        "shape_hash": "h",
+        "shape": "s",
+        "count": 2,
+        "total_ms": 20.0,
+        "max_ms": 15.0,
+        "p50_ms": 10.0,
+        "p95_ms": 15.0,
+        "updated_at": "2026-01-01T00:00:00+00:00",
+    }
+    save_stats(path, [row])
+    save_stats(
+        path, [row | {"count": 1, "total_ms": 4.0, "max_ms": 4.0, "p95_ms": 4.0}]
+    )
+    [stored] = load_stats(path, 10)
+    assert stored["count"] == 3
+    assert stored["total_ms"] == 24.0
+    assert stored["max_ms"] == 15.0
+    assert stored["p95_ms"] == 4.0
+
+
+def test_observe_query_flushes_periodically(store, monkeypatch):
+    monkeypatch.setattr(get_config(), "SLOW_QUERY_FLUSH_INTERVAL", 0.0)
+
+    async def scenario():
+        slow_queries.observe_query(None, None, "shape-a", 10.0)
+        await asyncio.gather(*slow_queries._flushes)
+
+    asyncio.run(scenario())
+    assert [row["count"] for row in load_stats(store, 10)] == [1]
+
+
+def test_captures_are_capped(store, monkeypatch):
+    started = []
+    gates: dict[str, asyncio.Event] = {}
+
+    async def fake_capture(sessionmaker, stmt, shape, elapsed_ms):
+        started.append(shape)
+        await gates[shape].wait()
+
+    monkeypatch.setattr(slow_queries, "capture", fake_capture)
+
+    async def scenario():
+        for shape in "abcd":
+            gates[shape] = asyncio.Event()
+        # a second capture of "a" waits for the first, "c" for a free slot
+        for shape in ["a", "a", "b", "c"]:
+            slow_queries.observe_query(None, None, shape, 500.0)
+        # fast queries are never captured
+        slow_queries.observe_query(None, None, "d", 1.0)
+        await asyncio.sleep(0)
+        in_flight = sorted(slow_queries._captures)
+        gates["a"].set()
+        await slow_queries._captures["a"]
+        await asyncio.sleep(0)
+        slow_queries.observe_query(None, None, "c", 500.0)
+        await asyncio.sleep(0)
+        after_release = sorted(slow_queries._captures)
+        for gate in gates.values():
+            gate.set()
+        await asyncio.gather(*slow_queries._captures.values())
+        return in_flight, after_release
+
+    in_flight, after_release = asyncio.run(scenario())
+    assert in_flight == ["a", "b"]
+    assert after_release == ["b", "c"]
+    assert started == ["a", "b", "c"]
+    assert slow_queries._captures == {}